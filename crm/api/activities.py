@@ -1,292 +1,398 @@
+import base64
+import heapq
 import json
 
-from bs4 import BeautifulSoup
 import frappe
 from frappe import _
 from frappe.utils.caching import redis_cache
-from frappe.desk.form.load import get_docinfo
+from crm.utils.html_extractor import find_element
 
-@frappe.whitelist()
-def get_activities(name):
-	if frappe.db.exists("CRM Deal", name):
-		return get_deal_activities(name)
-	elif frappe.db.exists("CRM Lead", name):
-		return get_lead_activities(name)
-	else:
-		frappe.throw(_("Document not found"), frappe.DoesNotExistError)
-
-def get_deal_activities(name):
-	get_docinfo('', "CRM Deal", name)
-	docinfo = frappe.response["docinfo"]
-	deal_meta = frappe.get_meta("CRM Deal")
-	deal_fields = {field.fieldname: {"label": field.label, "options": field.options} for field in deal_meta.fields}
-	avoid_fields = [
+TIMELINE_PAGE_LENGTH = 50
+
+AVOID_FIELDS = {
+	"CRM Deal": [
 		"lead",
 		"response_by",
 		"sla_creation",
 		"sla",
 		"first_response_time",
 		"first_responded_on",
-	]
-
-	doc = frappe.db.get_values("CRM Deal", name, ["creation", "owner", "lead"])[0]
-	lead = doc[2]
-
-	activities = []
-	calls = []
-	notes = []
-	tasks = []
-	attachments = []
-	creation_text = "created this deal"
-
-	if lead:
-		activities, calls, notes, tasks, attachments = get_lead_activities(lead)
-		creation_text = "converted the lead to this deal"
-
-	activities.append({
-		"activity_type": "creation",
-		"creation": doc[0],
-		"owner": doc[1],
-		"data": creation_text,
-		"is_lead": False,
-	})
-
-	docinfo.versions.reverse()
-
-	for version in docinfo.versions:
-		data = json.loads(version.data)
-		if not data.get("changed"):
-			continue
-
-		if change := data.get("changed")[0]:
-			field = deal_fields.get(change[0], None)
-
-			if not field or change[0] in avoid_fields or (not change[1] and not change[2]):
-				continue
-
-			field_label = field.get("label") or change[0]
-			field_option = field.get("options") or None
-
-			activity_type = "changed"
-			data = {
-				"field": change[0],
-				"field_label": field_label,
-				"old_value": change[1],
-				"value": change[2],
-			}
-
-			if not change[1] and change[2]:
-				activity_type = "added"
-				data = {
-					"field": change[0],
-					"field_label": field_label,
-					"value": change[2],
-				}
-			elif change[1] and not change[2]:
-				activity_type = "removed"
-				data = {
-					"field": change[0],
-					"field_label": field_label,
-					"value": change[1],
-				}
-
-		activity = {
-			"activity_type": activity_type,
-			"creation": version.creation,
-			"owner": version.owner,
-			"data": data,
-			"is_lead": False,
-			"options": field_option,
-		}
-		activities.append(activity)
-
-	for comment in docinfo.comments:
-		activity = {
-			"name": comment.name,
-			"activity_type": "comment",
-			"creation": comment.creation,
-			"owner": comment.owner,
-			"content": comment.content,
-			"attachments": get_attachments('Comment', comment.name),
-			"is_lead": False,
-		}
-		activities.append(activity)
-
-	for communication in docinfo.communications + docinfo.automated_messages:
-		activity = {
-			"activity_type": "communication",
-			"communication_type": communication.communication_type,
-			"creation": communication.creation,
-			"data": {
-				"subject": communication.subject,
-				"content": communication.content,
-				"sender_full_name": communication.sender_full_name,
-				"sender": communication.sender,
-				"recipients": communication.recipients,
-				"cc": communication.cc,
-				"bcc": communication.bcc,
-				"attachments": get_attachments('Communication', communication.name),
-				"read_by_recipient": communication.read_by_recipient,
-				"delivery_status": communication.delivery_status,
-			},
-			"is_lead": False,
-		}
-		activities.append(activity)
-
-	for attachment_log in docinfo.attachment_logs:
-		activity = {
-			"name": attachment_log.name,
-			"activity_type": "attachment_log",
-			"creation": attachment_log.creation,
-			"owner": attachment_log.owner,
-			"data": parse_attachment_log(attachment_log.content, attachment_log.comment_type),
-			"is_lead": False,
-		}
-		activities.append(activity)
-
-	calls = calls + get_linked_calls(name)
-	notes = notes + get_linked_notes(name)
-	tasks = tasks + get_linked_tasks(name)
-	attachments = attachments + get_attachments('CRM Deal', name)
-
-	activities.sort(key=lambda x: x["creation"], reverse=True)
-	activities = handle_multiple_versions(activities)
-
-	return activities, calls, notes, tasks, attachments
-
-def get_lead_activities(name):
-	get_docinfo('', "CRM Lead", name)
-	docinfo = frappe.response["docinfo"]
-	lead_meta = frappe.get_meta("CRM Lead")
-	lead_fields = {field.fieldname: {"label": field.label, "options": field.options} for field in lead_meta.fields}
-	avoid_fields = [
+	],
+	"CRM Lead": [
 		"converted",
 		"response_by",
 		"sla_creation",
 		"sla",
 		"first_response_time",
 		"first_responded_on",
-	]
-
-	doc = frappe.db.get_values("CRM Lead", name, ["creation", "owner"])[0]
-	activities = [{
-		"activity_type": "creation",
-		"creation": doc[0],
-		"owner": doc[1],
-		"data": "created this lead",
-		"is_lead": True,
-	}]
+	],
+}
+
+ATTACHMENT_FIELDS = ["name", "file_name", "file_type", "file_url", "file_size", "is_private", "creation", "owner"]
+CALL_FIELDS = [
+	"name",
+	"caller",
+	"receiver",
+	"from",
+	"to",
+	"duration",
+	"start_time",
+	"end_time",
+	"status",
+	"type",
+	"recording_url",
+	"creation",
+	"note",
+]
+NOTE_FIELDS = ["name", "title", "content", "owner", "modified"]
+TASK_FIELDS = [
+	"name",
+	"title",
+	"description",
+	"assigned_to",
+	"due_date",
+	"priority",
+	"status",
+	"modified",
+]
+
+# activity types of CRM Activity rows shown in the timeline
+TIMELINE_ACTIVITY_TYPES = ["changed", "added", "removed", "comment", "communication", "attachment_log"]
+# activity types of CRM Activity rows listed in their own tabs, with the key of their list
+LINKED_ACTIVITY_TYPES = {"call": "calls", "note": "notes", "task": "tasks", "attachment": "attachments"}
 
-	docinfo.versions.reverse()
+@frappe.whitelist()
+def get_activities(name, timeline=True):
+	"""
+	Get the timeline, calls, notes, tasks and attachments of a lead or deal
 
-	for version in docinfo.versions:
-		data = json.loads(version.data)
-		if not data.get("changed"):
-			continue
+	Everything is read from the CRM Activity rows of the document, and of the
+	lead a deal was converted from.
 
-		if change := data.get("changed")[0]:
-			field = lead_fields.get(change[0], None)
-
-			if not field or change[0] in avoid_fields or (not change[1] and not change[2]):
-				continue
-
-			field_label = field.get("label") or change[0]
-			field_option = field.get("options") or None
-
-			activity_type = "changed"
-			data = {
-				"field": change[0],
-				"field_label": field_label,
-				"old_value": change[1],
-				"value": change[2],
-			}
-
-			if not change[1] and change[2]:
-				activity_type = "added"
-				data = {
-					"field": change[0],
-					"field_label": field_label,
-					"value": change[2],
-				}
-			elif change[1] and not change[2]:
-				activity_type = "removed"
-				data = {
-					"field": change[0],
-					"field_label": field_label,
-					"value": change[1],
-				}
-
-		activity = {
-			"activity_type": activity_type,
-			"creation": version.creation,
-			"owner": version.owner,
-			"data": data,
-			"is_lead": True,
-			"options": field_option,
-		}
-		activities.append(activity)
+	:param timeline: Include the timeline. Pass False when it is paged with
+		`get_activities_page`, the timeline is then returned empty.
+	"""
+	doctype = get_timeline_doctype(name)
+	frappe.has_permission(doctype, "read", name, throw=True)
+	timeline = frappe.utils.sbool(timeline)
 
-	for comment in docinfo.comments:
-		activity = {
-			"name": comment.name,
-			"activity_type": "comment",
-			"creation": comment.creation,
-			"owner": comment.owner,
-			"content": comment.content,
-			"attachments": get_attachments('Comment', comment.name),
-			"is_lead": True,
-		}
-		activities.append(activity)
+	activities = []
+	linked = {key: [] for key in LINKED_ACTIVITY_TYPES.values()}
+	for reference in get_timeline_references(doctype, name):
+		filters = {"reference_doctype": reference[0], "reference_name": reference[1]}
+		if timeline:
+			activities.append(get_creation_activity(*reference))
+		else:
+			filters["activity_type"] = ["in", list(LINKED_ACTIVITY_TYPES)]
+
+		for row in frappe.get_all(
+			"CRM Activity",
+			filters=filters,
+			fields=["name", "activity_type", "creation", "data"],
+			order_by="creation desc, name desc",
+		):
+			activity = json.loads(row.data)
+			if row.activity_type in LINKED_ACTIVITY_TYPES:
+				linked[LINKED_ACTIVITY_TYPES[row.activity_type]].append(activity)
+			else:
+				activities.append((row.creation, row.name, activity))
+
+	activities.sort(key=lambda x: x[:2], reverse=True)
+	activities = handle_multiple_versions([activity for _creation, _name, activity in activities])
+	set_activity_attachments(activities)
+	set_communication_status(activities)
+
+	return activities, linked["calls"], linked["notes"], linked["tasks"], linked["attachments"]
+
+def get_timeline_doctype(name):
+	if frappe.db.exists("CRM Deal", name):
+		return "CRM Deal"
+	elif frappe.db.exists("CRM Lead", name):
+		return "CRM Lead"
+	frappe.throw(_("Document not found"), frappe.DoesNotExistError)
+
+def get_timeline_references(doctype, name):
+	"""Documents whose activities make up the timeline, as (doctype, name, is_lead, creation text)"""
+	if doctype == "CRM Lead":
+		return [(doctype, name, True, "created this lead")]
+
+	lead = frappe.db.get_value("CRM Deal", name, "lead")
+	if not lead:
+		return [(doctype, name, False, "created this deal")]
+	return [
+		(doctype, name, False, "converted the lead to this deal"),
+		("CRM Lead", lead, True, "created this lead"),
+	]
 
-	for communication in docinfo.communications + docinfo.automated_messages:
-		activity = {
-			"activity_type": "communication",
-			"communication_type": communication.communication_type,
-			"creation": communication.creation,
-			"data": {
-				"subject": communication.subject,
-				"content": communication.content,
-				"sender_full_name": communication.sender_full_name,
-				"sender": communication.sender,
-				"recipients": communication.recipients,
-				"cc": communication.cc,
-				"bcc": communication.bcc,
-				"attachments": get_attachments('Communication', communication.name),
-				"read_by_recipient": communication.read_by_recipient,
-				"delivery_status": communication.delivery_status,
-			},
-			"is_lead": True,
+def get_creation_activity(doctype, name, is_lead, creation_text):
+	"""Get (creation, name, activity) of the creation of a lead or deal"""
+	creation, owner = frappe.db.get_value(doctype, name, ["creation", "owner"])
+	return creation, name, {
+		"activity_type": "creation",
+		"creation": creation,
+		"owner": owner,
+		"data": creation_text,
+		"is_lead": is_lead,
+	}
+
+def get_timeline_fields(doctype):
+	meta = frappe.get_meta(doctype)
+	return {field.fieldname: {"label": field.label, "options": field.options} for field in meta.fields}
+
+def get_version_activity(version, fields, avoid_fields, is_lead):
+	data = json.loads(version.data)
+	if not data.get("changed"):
+		return None
+
+	change = data.get("changed")[0]
+	field = fields.get(change[0], None)
+
+	if not field or change[0] in avoid_fields or (not change[1] and not change[2]):
+		return None
+
+	field_label = field.get("label") or change[0]
+	field_option = field.get("options") or None
+
+	activity_type = "changed"
+	data = {
+		"field": change[0],
+		"field_label": field_label,
+		"old_value": change[1],
+		"value": change[2],
+	}
+
+	if not change[1] and change[2]:
+		activity_type = "added"
+		data = {
+			"field": change[0],
+			"field_label": field_label,
+			"value": change[2],
 		}
-		activities.append(activity)
-
-	for attachment_log in docinfo.attachment_logs:
-		activity = {
-			"name": attachment_log.name,
-			"activity_type": "attachment_log",
-			"creation": attachment_log.creation,
-			"owner": attachment_log.owner,
-			"data": parse_attachment_log(attachment_log.content, attachment_log.comment_type),
-			"is_lead": True,
+	elif change[1] and not change[2]:
+		activity_type = "removed"
+		data = {
+			"field": change[0],
+			"field_label": field_label,
+			"value": change[1],
 		}
-		activities.append(activity)
 
-	calls = get_linked_calls(name)
-	notes = get_linked_notes(name)
-	tasks = get_linked_tasks(name)
-	attachments = get_attachments('CRM Lead', name)
-
-	activities.sort(key=lambda x: x["creation"], reverse=True)
-	activities = handle_multiple_versions(activities)
+	return {
+		"activity_type": activity_type,
+		"creation": version.creation,
+		"owner": version.owner,
+		"data": data,
+		"is_lead": is_lead,
+		"options": field_option,
+	}
+
+def get_comment_activity(comment, is_lead):
+	return {
+		"name": comment.name,
+		"activity_type": "comment",
+		"creation": comment.creation,
+		"owner": comment.owner,
+		"content": comment.content,
+		"attachments": [],
+		"is_lead": is_lead,
+	}
+
+def get_communication_activity(communication, is_lead):
+	return {
+		"name": communication.name,
+		"activity_type": "communication",
+		"communication_type": communication.communication_type,
+		"creation": communication.creation,
+		"data": {
+			"subject": communication.subject,
+			"content": communication.content,
+			"sender_full_name": communication.sender_full_name,
+			"sender": communication.sender,
+			"recipients": communication.recipients,
+			"cc": communication.cc,
+			"bcc": communication.bcc,
+			"attachments": [],
+			"read_by_recipient": communication.read_by_recipient,
+			"delivery_status": communication.delivery_status,
+		},
+		"is_lead": is_lead,
+	}
+
+def get_attachment_log_activity(attachment_log, is_lead):
+	return {
+		"name": attachment_log.name,
+		"activity_type": "attachment_log",
+		"creation": attachment_log.creation,
+		"owner": attachment_log.owner,
+		"data": parse_attachment_log(attachment_log.content, attachment_log.comment_type),
+		"is_lead": is_lead,
+	}
 
-	return activities, calls, notes, tasks, attachments
+@frappe.whitelist()
+def get_activities_page(name, cursor=None, page_length=TIMELINE_PAGE_LENGTH):
+	"""
+	Get one page of the timeline of a lead or deal, newest first
+
+	The CRM Activity rows of the deal and of the lead it was converted from are
+	read as separate streams, in pages ordered by `creation`. The streams are
+	merged lazily, so only about a page of rows is read from each of them. A page never
+	ends while `handle_multiple_versions` would still be grouping versions, so
+	pages put together match the whole timeline.
+
+	:param name: Name of the lead or deal
+	:param cursor: `cursor` of the previous page
+	:param page_length: Minimum number of activities to return
+	:return: `activities` of the page and the `cursor` of the next one, if any
+	"""
+	doctype = get_timeline_doctype(name)
+	frappe.has_permission(doctype, "read", name, throw=True)
+
+	page_length = max(frappe.utils.cint(page_length), 1)
+	positions = decode_timeline_cursor(cursor) if cursor else {}
+	streams = get_timeline_streams(doctype, name, positions, page_length + 1)
 
+	activities = []
+	has_more = False
+	for creation, item_name, key, activity in heapq.merge(*streams, key=lambda item: item[:2], reverse=True):
+		if len(activities) >= page_length and not is_pending_in_version_group(activities[-1], activity):
+			has_more = True
+			break
+		activities.append(activity)
+		positions[key] = [str(creation), item_name]
 
-def get_attachments(doctype, name):
-	return frappe.db.get_all(
+	set_activity_attachments(activities)
+	set_communication_status(activities)
+	return {
+		"activities": handle_multiple_versions(activities),
+		"cursor": encode_timeline_cursor(positions) if has_more else None,
+	}
+
+def get_timeline_streams(doctype, name, positions, batch_size):
+	streams = []
+	for reference in get_timeline_references(doctype, name):
+		ref_doctype, ref_name = reference[:2]
+
+		key = f"{ref_doctype}:creation"
+		if key not in positions:
+			creation, _name, activity = get_creation_activity(*reference)
+			streams.append(iter([(creation, ref_name, key, activity)]))
+
+		key = f"{ref_doctype}:activities"
+		streams.append(get_timeline_stream(
+			key,
+			positions.get(key),
+			"CRM Activity",
+			["name", "creation", "data"],
+			{
+				"reference_doctype": ref_doctype,
+				"reference_name": ref_name,
+				"activity_type": ["in", TIMELINE_ACTIVITY_TYPES],
+			},
+			lambda row: json.loads(row.data),
+			batch_size,
+		))
+
+	return streams
+
+def get_timeline_stream(key, position, doctype, fields, filters, build, batch_size):
+	"""
+	Yield (creation, name, key, activity) for rows of `doctype` older than
+	`position`, newest first, reading `batch_size` rows at a time
+	"""
+	while True:
+		filters = dict(filters)
+		or_filters = None
+		if position:
+			creation, name = position
+			or_filters = [
+				[doctype, "creation", "<", creation],
+				[doctype, "name", "<", name],
+			]
+			filters["creation"] = ["<=", creation]
+		rows = frappe.get_all(
+			doctype,
+			filters=filters,
+			or_filters=or_filters,
+			fields=fields,
+			order_by="creation desc, name desc",
+			limit=batch_size,
+		)
+		for row in rows:
+			position = (row.creation, row.name)
+			activity = build(row)
+			if activity:
+				yield row.creation, row.name, key, activity
+		if len(rows) < batch_size:
+			return
+
+def is_pending_in_version_group(previous, activity):
+	"""
+	Whether `handle_multiple_versions` still holds `previous` in a group of
+	versions when it reaches `activity`. That is the case unless `activity` is a
+	version of another owner, which starts a new group.
+	"""
+	versions = ["changed", "added", "removed"]
+	if previous["activity_type"] not in versions:
+		return False
+	return activity["activity_type"] not in versions or activity["owner"] == previous["owner"]
+
+def encode_timeline_cursor(positions):
+	return base64.urlsafe_b64encode(json.dumps(positions).encode()).decode()
+
+def decode_timeline_cursor(cursor):
+	try:
+		positions = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+	except Exception:
+		frappe.throw(_("Invalid cursor"))
+	if not isinstance(positions, dict):
+		frappe.throw(_("Invalid cursor"))
+	return positions
+
+def set_activity_attachments(activities):
+	"""Set attachments of comments and communications, with one File query per doctype"""
+	comments = [a for a in activities if a["activity_type"] == "comment"]
+	communications = [a for a in activities if a["activity_type"] == "communication"]
+
+	attachments = get_attachments_by_name("Comment", [a["name"] for a in comments])
+	for activity in comments:
+		activity["attachments"] = attachments.get(activity["name"], [])
+
+	attachments = get_attachments_by_name("Communication", [a["name"] for a in communications])
+	for activity in communications:
+		activity["data"]["attachments"] = attachments.get(activity["name"], [])
+
+def set_communication_status(activities):
+	"""Refresh the read and delivery status of communications, which change without a save"""
+	communications = [a for a in activities if a["activity_type"] == "communication"]
+	if not communications:
+		return
+
+	status = {
+		c.name: c
+		for c in frappe.get_all(
+			"Communication",
+			filters={"name": ["in", [a["name"] for a in communications]]},
+			fields=["name", "read_by_recipient", "delivery_status"],
+		)
+	}
+	for activity in communications:
+		if row := status.get(activity["name"]):
+			activity["data"]["read_by_recipient"] = row.read_by_recipient
+			activity["data"]["delivery_status"] = row.delivery_status
+
+def get_attachments_by_name(doctype, names):
+	"""Get attachments of the `doctype` documents `names`, keyed by document name"""
+	if not names:
+		return {}
+
+	files = frappe.db.get_all(
 		"File",
-		filters={"attached_to_doctype": doctype, "attached_to_name": name},
-		fields=["name", "file_name", "file_type", "file_url", "file_size", "is_private", "creation", "owner"],
-	) or []
+		filters={"attached_to_doctype": doctype, "attached_to_name": ["in", names]},
+		fields=ATTACHMENT_FIELDS + ["attached_to_name"],
+	)
+	res = {}
+	for file in files:
+		res.setdefault(file.pop("attached_to_name"), []).append(file)
+	return res
 
 def handle_multiple_versions(versions):
 	activities = []
@@ -308,8 +414,9 @@ def handle_multiple_versions(versions):
 			grouped_versions = []
 			if is_version: grouped_versions.append(version)
 		old_version = version
-		if version == versions[-1] and grouped_versions:
-			activities.append(parse_grouped_versions(grouped_versions))
+
+	if grouped_versions:
+		activities.append(parse_grouped_versions(grouped_versions))
 
 	return activities
 
@@ -321,57 +428,8 @@ def parse_grouped_versions(versions):
 	version["other_versions"] = other_versions
 	return version
 
-def get_linked_calls(name):
-	calls = frappe.db.get_all(
-		"CRM Call Log",
-		filters={"reference_docname": name},
-		fields=[
-			"name",
-			"caller",
-			"receiver",
-			"from",
-			"to",
-			"duration",
-			"start_time",
-			"end_time",
-			"status",
-			"type",
-			"recording_url",
-			"creation",
-			"note",
-		],
-	)
-	return calls or []
-
-def get_linked_notes(name):
-	notes = frappe.db.get_all(
-		"FCRM Note",
-		filters={"reference_docname": name},
-		fields=['name', 'title', 'content', 'owner', 'modified'],
-	)
-	return notes or []
-
-def get_linked_tasks(name):
-	tasks = frappe.db.get_all(
-		"CRM Task",
-		filters={"reference_docname": name},
-		fields=[
-			"name",
-			"title",
-			"description",
-			"assigned_to",
-			"assigned_to",
-			"due_date",
-			"priority",
-			"status",
-			"modified",
-		],
-	)
-	return tasks or []
-
 def parse_attachment_log(html, type):
-	soup = BeautifulSoup(html, "html.parser")
-	a_tag = soup.find("a")
+	a_tag = find_element(html, "a", with_text=True)
 	type = "added" if type == "Attachment" else "removed"
 	if not a_tag:
 		return {
@@ -381,13 +439,15 @@ def parse_attachment_log(html, type):
 			"is_private": False,
 		}
 
+	attrs, text = a_tag
+	href = attrs.get("href") or ""
 	is_private = False
-	if "private/files" in a_tag["href"]:
+	if "private/files" in href:
 		is_private = True
 
 	return {
 		"type": type,
-		"file_name": a_tag.text,
-		"file_url": a_tag["href"],
+		"file_name": text,
+		"file_url": href,
 		"is_private": is_private,
 	}
\ No newline at end of file
@@ -1,12 +1,15 @@
 import frappe
 from frappe import _
 
+from crm.utils import normalize_phone_number
+
 
 def validate(doc, method):
 	set_primary_email(doc)
 	set_primary_mobile_no(doc)
 	doc.set_primary_email()
 	doc.set_primary("mobile_no")
+	set_normalized_phone_nos(doc)
 	update_deals_email_mobile_no(doc)
 
 
@@ -26,6 +29,11 @@ def set_primary_mobile_no(doc):
 		doc.phone_nos[0].is_primary_mobile_no = 1
 
 
+def set_normalized_phone_nos(doc):
+	for phone in doc.phone_nos:
+		phone.normalized_phone = normalize_phone_number(phone.phone)
+
+
 def update_deals_email_mobile_no(doc):
 	linked_deals = frappe.get_all(
 		"CRM Contacts",
@@ -1,18 +1,23 @@
+import base64
 import frappe
+import hashlib
 import json
 from frappe import _
 from frappe.model.document import get_controller
-from frappe.model import no_value_fields
+from frappe.model import default_fields, no_value_fields, optional_fields
+from frappe.query_builder.functions import Count
 from pypika import Criterion
-from frappe.utils import make_filter_tuple
+from frappe.utils import cint, cstr, make_filter_tuple, sbool
+from werkzeug.wrappers import Response
 
+from crm.api.meta import get_field_descriptors
 from crm.api.views import get_views
 from crm.fcrm.doctype.crm_form_script.crm_form_script import get_form_script
 
 
 @frappe.whitelist()
 def sort_options(doctype: str):
-	fields = frappe.get_meta(doctype).fields
+	fields = get_field_descriptors(doctype)
 	fields = [field for field in fields if field.fieldtype not in no_value_fields]
 	fields = [
 		{
@@ -65,15 +70,22 @@ def get_filterable_fields(doctype: str):
 
 	res = []
 
-	# append DocFields
-	DocField = frappe.qb.DocType("DocField")
-	doc_fields = get_doctype_fields_meta(DocField, doctype, allowed_fieldtypes, restricted_fields)
-	res.extend(doc_fields)
-
-	# append Custom Fields
-	CustomField = frappe.qb.DocType("Custom Field")
-	custom_fields = get_doctype_fields_meta(CustomField, doctype, allowed_fieldtypes, restricted_fields)
-	res.extend(custom_fields)
+	# append DocFields followed by Custom Fields
+	fields = [
+		field for field in get_field_descriptors(doctype)
+		if not field.hidden
+		and field.fieldtype in allowed_fieldtypes
+		and field.fieldname not in restricted_fields
+	]
+	fields.sort(key=lambda field: bool(field.is_custom_field))
+	for field in fields:
+		res.append({
+			"fieldname": field.fieldname,
+			"fieldtype": field.fieldtype,
+			"label": field.label,
+			"name": field.name,
+			"options": field.options,
+		})
 
 	# append standard fields (getting error when using frappe.model.std_fields)
 	standard_fields = [
@@ -127,7 +139,7 @@ def get_group_by_fields(doctype: str):
 		"Datetime",
 	]
 
-	fields = frappe.get_meta(doctype).fields
+	fields = get_field_descriptors(doctype)
 	fields = [field for field in fields if field.fieldtype not in no_value_fields and field.fieldtype in allowed_fieldtypes]
 	fields = [
 		{
@@ -158,28 +170,9 @@ def get_group_by_fields(doctype: str):
 	return fields
 
 
-def get_doctype_fields_meta(DocField, doctype, allowed_fieldtypes, restricted_fields):
-	parent = "parent" if DocField._table_name == "tabDocField" else "dt"
-	return (
-		frappe.qb.from_(DocField)
-		.select(
-			DocField.fieldname,
-			DocField.fieldtype,
-			DocField.label,
-			DocField.name,
-			DocField.options,
-		)
-		.where(DocField[parent] == doctype)
-		.where(DocField.hidden == False)
-		.where(Criterion.any([DocField.fieldtype == i for i in allowed_fieldtypes]))
-		.where(Criterion.all([DocField.fieldname != i for i in restricted_fields]))
-		.run(as_dict=True)
-	)
-
 @frappe.whitelist()
 def get_quick_filters(doctype: str):
-	meta = frappe.get_meta(doctype)
-	fields = [field for field in meta.fields if field.in_standard_filter]
+	fields = [field for field in get_field_descriptors(doctype) if field.in_standard_filter]
 	quick_filters = []
 
 	for field in fields:
@@ -215,6 +208,10 @@ def get_data(
 	kanban_fields=[],
 	view=None,
 	default_filters=None,
+	cached_count=False,
+	cursor=None,
+	slim=False,
+	group_by_sum_fields=None,
 ):
 	custom_view = False
 	filters = frappe._dict(filters)
@@ -227,17 +224,7 @@ def get_data(
 	view_type = view.get('view_type') if view else None
 	group_by_field = view.get('group_by_field') if view else None
 
-	for key in filters:
-		value = filters[key]
-		if isinstance(value, list):
-			if "@me" in value:
-				value[value.index("@me")] = frappe.session.user
-			elif "%@me%" in value:
-				index = [i for i, v in enumerate(value) if v == "%@me%"]
-				for i in index:
-					value[i] = "%" + frappe.session.user + "%"
-		elif value == "@me":
-			filters[key] = frappe.session.user
+	replace_session_user_in_filters(filters)
 
 	if default_filters:
 		default_filters = frappe.parse_json(default_filters)
@@ -245,6 +232,7 @@ def get_data(
 
 	is_default = True
 	data = []
+	next_cursor = None
 	_list = get_controller(doctype)
 	default_rows = []
 	if hasattr(_list, "default_list_data"):
@@ -295,13 +283,9 @@ def get_data(
 		if group_by_field and group_by_field not in rows:
 			rows.append(group_by_field)
 
-		data = frappe.get_list(
-			doctype,
-			fields=rows,
-			filters=filters,
-			order_by=order_by,
-			page_length=page_length,
-		) or []
+		# group by views load the rows of each group with get_group_by_data
+		if view_type != "group_by":
+			data, next_cursor = get_list_records(doctype, rows, filters, order_by, page_length, cursor)
 
 	if view_type == "kanban":
 		if not rows:
@@ -335,39 +319,32 @@ def get_data(
 			if field not in rows:
 				rows.append(field)
 
+		def is_hidden_column(kc):
+			return column_field in filters and filters.get(column_field) != kc.get("name") or kc.get("delete")
+
+		windowed_columns = [kc for kc in kanban_columns if not is_hidden_column(kc) and not kc.get("order")]
+		column_records = get_kanban_column_records(
+			doctype, rows, filters, order_by, column_field, windowed_columns
+		)
+		column_counts = get_kanban_column_counts(doctype, filters, column_field)
+
+		cards = []
 		for kc in kanban_columns:
-			column_filters = { column_field: kc.get('name') }
 			order = kc.get("order")
-			if column_field in filters and filters.get(column_field) != kc.name or kc.get('delete'):
+			if is_hidden_column(kc):
 				column_data = []
 			else:
-				column_filters.update(filters.copy())
-				page_length = 20
-
-				if kc.get("page_length"):
-					page_length = kc.get("page_length")
-
 				if order:
+					column_filters = { column_field: kc.get('name') }
+					column_filters.update(filters.copy())
+					page_length = kc.get("page_length") or 20
 					column_data = get_records_based_on_order(doctype, rows, column_filters, page_length, order)
 				else:
-					column_data = frappe.get_list(
-						doctype,
-						fields=rows,
-						filters=convert_filter_to_tuple(doctype, column_filters),
-						order_by=order_by,
-						page_length=page_length,
-					)
-
-				new_filters = filters.copy()
-				new_filters.update({ column_field: kc.get('name') })
-
-				all_count = len(frappe.get_list(doctype, filters=convert_filter_to_tuple(doctype, new_filters)))
+					column_data = column_records.get(kc.get("name"), [])
 
-				kc["all_count"] = all_count
+				kc["all_count"] = column_counts.get(kc.get("name"), 0)
 				kc["count"] = len(column_data)
-
-				for d in column_data:
-					getCounts(d, doctype)
+				cards.extend(column_data)
 
 			if order:
 				column_data = sorted(
@@ -377,52 +354,25 @@ def get_data(
 
 			data.append({"column": kc, "fields": kanban_fields, "data": column_data})
 
-	fields = frappe.get_meta(doctype).fields
-	fields = [field for field in fields if field.fieldtype not in no_value_fields]
-	fields = [
-		{
-			"label": _(field.label),
-			"type": field.fieldtype,
-			"value": field.fieldname,
-			"options": field.options,
-		}
-		for field in fields
-		if field.label and field.fieldname
-	]
+		set_activity_counts(cards, doctype)
 
-	std_fields = [
-		{"label": "Name", "type": "Data", "value": "name"},
-		{"label": "Created On", "type": "Datetime", "value": "creation"},
-		{"label": "Last Modified", "type": "Datetime", "value": "modified"},
-		{
-			"label": "Modified By",
-			"type": "Link",
-			"value": "modified_by",
-			"options": "User",
-		},
-		{"label": "Assigned To", "type": "Text", "value": "_assign"},
-		{"label": "Owner", "type": "Link", "value": "owner", "options": "User"},
-		{"label": "Like", "type": "Data", "value": "_liked_by"},
-	]
-
-	for field in std_fields:
+	fields = get_view_fields(doctype)
+	for field in get_standard_view_fields():
 		if field.get('value') not in rows:
 			rows.append(field.get('value'))
-		if field not in fields:
-			field["label"] = _(field["label"])
-			fields.append(field)
 
 	if not is_default and custom_view_name:
 		is_default = frappe.db.get_value("CRM View Settings", custom_view_name, "load_default_columns")
 
 	if group_by_field and view_type == "group_by":
+		groups = get_group_by_counts(doctype, filters, group_by_field, group_by_sum_fields)
+
 		def get_options(type, options):
 			if type == "Select":
 				return [option for option in options.split("\n")]
 			else:
-				has_empty_values = any([not d.get(group_by_field) for d in data])
-				options = list(set([d.get(group_by_field) for d in data]))
-				options = [u for u in options if u]
+				has_empty_values = any([group["value"] == "" for group in groups])
+				options = [group["value"] for group in groups if group["value"] != ""]
 				if has_empty_values:
 					options.append("")
 
@@ -444,13 +394,13 @@ def get_data(
 					"name": field.get("value"),
 					"type": field.get("type"),
 					"options": get_options(field.get("type"), field.get("options")),
+					"groups": groups,
 				}
 
-	return {
+	res = {
 		"data": data,
 		"columns": columns,
 		"rows": rows,
-		"fields": fields,
 		"column_field": column_field,
 		"title_field": title_field,
 		"kanban_columns": kanban_columns,
@@ -459,14 +409,268 @@ def get_data(
 		"page_length": page_length,
 		"page_length_count": page_length_count,
 		"is_default": is_default,
-		"views": get_views(doctype),
-		"total_count": len(frappe.get_list(doctype, filters=filters)),
+		"total_count": get_total_count(doctype, filters, sbool(cached_count)),
 		"row_count": len(data),
+		"next_cursor": next_cursor,
+		"view_type": view_type,
+	}
+
+	# slim responses leave out the static view metadata served by get_view_meta
+	if not sbool(slim):
+		res.update(get_view_meta_data(doctype, fields))
+
+	return res
+
+
+@frappe.whitelist()
+def get_view_meta(doctype: str):
+	"""
+	Get the static metadata of the views of `doctype`: fields, saved views and
+	form/list scripts. `get_data` leaves these out when called with `slim`.
+
+	The response carries an ETag of its content and is answered with
+	304 Not Modified when the client sends a matching If-None-Match,
+	so fetch it with GET to let the browser revalidate its copy.
+	"""
+	return get_etag_response(get_view_meta_data(doctype))
+
+
+def get_view_meta_data(doctype, fields=None):
+	return {
+		"fields": fields or get_view_fields(doctype),
+		"views": get_views(doctype),
 		"form_script": get_form_script(doctype),
 		"list_script": get_form_script(doctype, "List"),
-		"view_type": view_type,
 	}
 
+
+def get_view_fields(doctype):
+	fields = get_field_descriptors(doctype)
+	fields = [field for field in fields if field.fieldtype not in no_value_fields]
+	fields = [
+		{
+			"label": _(field.label),
+			"type": field.fieldtype,
+			"value": field.fieldname,
+			"options": field.options,
+		}
+		for field in fields
+		if field.label and field.fieldname
+	]
+
+	for field in get_standard_view_fields():
+		if field not in fields:
+			field["label"] = _(field["label"])
+			fields.append(field)
+
+	return fields
+
+
+def get_standard_view_fields():
+	return [
+		{"label": "Name", "type": "Data", "value": "name"},
+		{"label": "Created On", "type": "Datetime", "value": "creation"},
+		{"label": "Last Modified", "type": "Datetime", "value": "modified"},
+		{
+			"label": "Modified By",
+			"type": "Link",
+			"value": "modified_by",
+			"options": "User",
+		},
+		{"label": "Assigned To", "type": "Text", "value": "_assign"},
+		{"label": "Owner", "type": "Link", "value": "owner", "options": "User"},
+		{"label": "Like", "type": "Data", "value": "_liked_by"},
+	]
+
+
+def get_etag_response(message):
+	"""Wrap `message` in a JSON response with an ETag of its content"""
+	payload = frappe.as_json({"message": message}, indent=None)
+	etag = hashlib.sha256(payload.encode()).hexdigest()
+
+	request = getattr(frappe.local, "request", None)
+	if request and request.if_none_match.contains_weak(etag):
+		response = Response(status=304)
+	else:
+		response = Response(payload, mimetype="application/json")
+
+	response.set_etag(etag)
+	response.headers["Cache-Control"] = "private, no-cache"
+	return response
+
+
+@frappe.whitelist()
+def get_group_by_counts(doctype: str, filters: dict, group_by_field: str, sum_fields=None):
+	"""
+	Get every distinct value of `group_by_field` among the records the session
+	user can read with `filters`, in one GROUP BY query
+
+	:param sum_fields: Currency or number fields to total per group
+	:return: List of groups with `value`, `count` and a total per sum field.
+		Empty values are merged into the "" group.
+	"""
+	filters = frappe._dict(frappe.parse_json(filters or "{}"))
+	replace_session_user_in_filters(filters)
+	validate_fieldname(doctype, group_by_field)
+
+	sum_fields = frappe.parse_json(sum_fields or "[]")
+	sum_fields = [
+		field.fieldname for field in get_field_descriptors(doctype)
+		if field.fieldname in sum_fields
+		and field.fieldtype in ("Currency", "Float", "Int", "Percent")
+		and field.fieldname != group_by_field
+	]
+
+	rows = frappe.get_list(
+		doctype,
+		fields=[group_by_field, "count(*) as count"] + [
+			f"sum(`tab{doctype}`.`{fieldname}`) as `{fieldname}`" for fieldname in sum_fields
+		],
+		filters=convert_filter_to_tuple(doctype, filters.copy()),
+		group_by=f"`tab{doctype}`.`{group_by_field}`",
+		order_by=f"`tab{doctype}`.`{group_by_field}` asc",
+	)
+
+	groups = {}
+	for row in rows:
+		value = row.get(group_by_field)
+		value = "" if value is None else value
+		group = groups.setdefault(value, {"value": value, "count": 0, **{f: 0 for f in sum_fields}})
+		group["count"] += row.get("count") or 0
+		for fieldname in sum_fields:
+			group[fieldname] += row.get(fieldname) or 0
+
+	return list(groups.values())
+
+
+@frappe.whitelist()
+def get_group_by_data(
+	doctype: str,
+	filters: dict,
+	order_by: str,
+	group_by_field: str,
+	group_value=None,
+	rows=None,
+	page_length=20,
+	cursor=None,
+):
+	"""
+	Get one page of the records of a single group of the group by view, so that
+	groups can be expanded lazily. Pass the returned `next_cursor` back to get
+	the following page.
+	"""
+	filters = frappe._dict(frappe.parse_json(filters or "{}"))
+	replace_session_user_in_filters(filters)
+	validate_fieldname(doctype, group_by_field)
+	rows = frappe.parse_json(rows or "[]") or ["name"]
+
+	filters[group_by_field] = ["is", "not set"] if group_value in (None, "") else group_value
+	data, next_cursor = get_list_records(doctype, rows, filters, order_by, page_length, cursor)
+
+	return {
+		"data": data,
+		"row_count": len(data),
+		"next_cursor": next_cursor,
+	}
+
+
+def get_list_records(doctype, rows, filters, order_by, page_length, cursor=None):
+	"""
+	Get one page of records, ordered by `order_by` plus `name` so that the page
+	can be continued with the returned cursor
+
+	:return: Records and the cursor of the next page, if there may be one
+	"""
+	order = parse_order_by(doctype, order_by)
+	fields = rows + [fieldname for fieldname, _direction in order if fieldname not in rows]
+
+	if cursor:
+		data = get_records_after_cursor(doctype, fields, filters, order, page_length, cursor)
+	else:
+		data = frappe.get_list(
+			doctype,
+			fields=fields,
+			filters=filters,
+			order_by=get_order_by_clause(doctype, order),
+			page_length=page_length,
+		) or []
+
+	next_cursor = None
+	if cint(page_length) and len(data) >= cint(page_length):
+		next_cursor = encode_cursor(order, data[-1])
+
+	return data, next_cursor
+
+
+def replace_session_user_in_filters(filters):
+	for key in filters:
+		value = filters[key]
+		if isinstance(value, list):
+			if "@me" in value:
+				value[value.index("@me")] = frappe.session.user
+			elif "%@me%" in value:
+				index = [i for i, v in enumerate(value) if v == "%@me%"]
+				for i in index:
+					value[i] = "%" + frappe.session.user + "%"
+		elif value == "@me":
+			filters[key] = frappe.session.user
+	return filters
+
+
+def get_total_count(doctype, filters, cached=False):
+	"""
+	Get the number of `doctype` records the session user can read with `filters`
+
+	:param cached: Serve the count from redis for up to `TOTAL_COUNT_CACHE_TTL`
+		seconds. Counts are keyed by a hash of the permission-aware count query,
+		which covers the doctype, the normalized filters and the user's
+		permission conditions, so users with different access never share one.
+		Saving or deleting a record of `doctype` invalidates all its counts.
+	:return: Number of records
+	"""
+	args = {
+		"fields": [f"count(`tab{doctype}`.name) as total_count"],
+		"filters": convert_filter_to_tuple(doctype, filters.copy()),
+		"order_by": None,
+	}
+	if not cached:
+		return frappe.get_list(doctype, **args)[0].get("total_count")
+
+	query = frappe.get_list(doctype, **args, run=0)
+	query_key = hashlib.sha256(query.encode()).hexdigest()
+	cache_key = f"crm_total_count:{doctype}:{get_total_count_version(doctype)}:{query_key}"
+
+	count = frappe.cache.get_value(cache_key)
+	if count is not None:
+		return count
+
+	count = frappe.db.sql(query)[0][0]
+	frappe.cache.set_value(cache_key, count, expires_in_sec=TOTAL_COUNT_CACHE_TTL)
+	return count
+
+
+def get_total_count_version(doctype):
+	"""
+	Version of the cached counts of `doctype`; a new version leaves the counts
+	of older ones to expire
+	"""
+	version_key = get_total_count_version_key(doctype)
+	version = frappe.cache.get_value(version_key)
+	if not version:
+		version = frappe.generate_hash(length=8)
+		frappe.cache.set_value(version_key, version)
+	return version
+
+
+def get_total_count_version_key(doctype):
+	return f"crm_total_count_version:{doctype}"
+
+
+def clear_total_count_cache(doc, method=None):
+	"""Drop cached list counts of the doctype of `doc`, called on save and delete"""
+	frappe.cache.delete_value(get_total_count_version_key(doc.doctype))
+
+
 def convert_filter_to_tuple(doctype, filters):
 	if isinstance(filters, dict):
 		filters_items = filters.items()
@@ -476,6 +680,208 @@ def convert_filter_to_tuple(doctype, filters):
 	return filters
 
 
+def get_kanban_column_records(doctype, rows, filters, order_by, column_field, kanban_columns):
+	"""
+	Get the top `page_length` records of every kanban column in a single query,
+	ranking records within each column with ROW_NUMBER() over `column_field`
+
+	:return: Dict of records keyed by column name
+	"""
+	if not kanban_columns:
+		return {}
+
+	validate_fieldname(doctype, column_field)
+	order = parse_order_by(doctype, order_by)
+
+	fields = list(rows)
+	for fieldname in [column_field] + [fieldname for fieldname, _direction in order]:
+		if fieldname not in fields:
+			fields.append(fieldname)
+
+	column_names = [kc.get("name") for kc in kanban_columns]
+	column_filters = convert_filter_to_tuple(doctype, filters.copy())
+	column_filters.append([doctype, column_field, "in", column_names])
+
+	# permission-aware base query, ranked and limited per column below
+	base_query = frappe.get_list(
+		doctype,
+		fields=fields,
+		filters=column_filters,
+		order_by=order_by,
+		run=0,
+	)
+
+	window_order = ", ".join(f"base.`{fieldname}` {direction}" for fieldname, direction in order)
+	page_lengths = " ".join(
+		f"when {frappe.db.escape(kc.get('name'))} then {cint(kc.get('page_length')) or 20}"
+		for kc in kanban_columns
+	)
+
+	records = frappe.db.sql(
+		f"""
+		select * from (
+			select base.*, row_number() over (
+				partition by base.`{column_field}` order by {window_order}
+			) as `_kanban_rank`
+			from ({base_query}) base
+		) ranked
+		where ranked.`_kanban_rank` <= case ranked.`{column_field}` {page_lengths} else 0 end
+		order by ranked.`_kanban_rank`
+		""",
+		as_dict=True,
+	)
+
+	column_records = {name: [] for name in column_names}
+	for record in records:
+		record.pop("_kanban_rank", None)
+		column_records.setdefault(record.get(column_field), []).append(record)
+
+	return column_records
+
+
+def get_kanban_column_counts(doctype, filters, column_field):
+	"""
+	Get the number of records in every kanban column with one GROUP BY query
+
+	:return: Dict of counts keyed by column name
+	"""
+	if not column_field:
+		return {}
+
+	validate_fieldname(doctype, column_field)
+	counts = frappe.get_list(
+		doctype,
+		fields=[column_field, "count(*) as count"],
+		filters=convert_filter_to_tuple(doctype, filters.copy()),
+		group_by=column_field,
+		order_by=column_field,
+	)
+	return {d.get(column_field): d.get("count") for d in counts}
+
+
+def parse_order_by(doctype, order_by, default="modified desc"):
+	"""
+	Parse `order_by` into a list of (fieldname, direction) pairs, dropping
+	anything that is not a field of `doctype`. `name` is always appended
+	so that the resulting order is total.
+	"""
+	order = []
+	for part in (order_by or default).split(","):
+		tokens = part.strip().split()
+		if not tokens:
+			continue
+		fieldname = tokens[0].split(".")[-1].strip("`")
+		direction = tokens[1].lower() if len(tokens) > 1 else "asc"
+		if direction not in ("asc", "desc") or not is_valid_fieldname(doctype, fieldname):
+			continue
+		if fieldname not in [f for f, _d in order]:
+			order.append((fieldname, direction))
+
+	if "name" not in [f for f, _d in order]:
+		order.append(("name", order[-1][1] if order else "desc"))
+
+	return order
+
+
+def get_order_by_clause(doctype, order, table=None):
+	table = table or f"`tab{doctype}`"
+	return ", ".join(f"{table}.`{fieldname}` {direction}" for fieldname, direction in order)
+
+
+def get_records_after_cursor(doctype, fields, filters, order, page_length, cursor):
+	"""
+	Get the next `page_length` records after `cursor` with a seek predicate on
+	the order key, so that deep pages cost the same as the first one
+	"""
+	values = decode_cursor(cursor, order)
+	base_query = frappe.get_list(
+		doctype,
+		fields=fields,
+		filters=convert_filter_to_tuple(doctype, filters.copy()),
+		order_by=get_order_by_clause(doctype, order),
+		run=0,
+	)
+
+	return frappe.db.sql(
+		f"""
+		select * from ({base_query}) base
+		where {get_seek_condition(order, values, "base")}
+		order by {get_order_by_clause(doctype, order, "base")}
+		limit {cint(page_length) or 20}
+		""",
+		as_dict=True,
+	)
+
+
+def get_seek_condition(order, values, table):
+	"""
+	Build the condition matching records that sort after `values` in `order`.
+	NULLs sort first in ascending and last in descending order, as in MariaDB.
+	"""
+	conditions = []
+	for i, (fieldname, direction) in enumerate(order):
+		column = f"{table}.`{fieldname}`"
+		value = values[i]
+		if direction == "asc":
+			after = f"{column} is not null" if value is None else f"{column} > {get_sql_value(value)}"
+		elif value is None:
+			# nothing sorts after NULL in descending order
+			after = None
+		else:
+			after = f"({column} < {get_sql_value(value)} or {column} is null)"
+
+		if after:
+			equal = [
+				f"{table}.`{f}` is null" if v is None else f"{table}.`{f}` = {get_sql_value(v)}"
+				for (f, _d), v in zip(order[:i], values[:i])
+			]
+			conditions.append("(" + " and ".join(equal + [after]) + ")")
+
+	return " or ".join(conditions) or "1 = 0"
+
+
+def get_sql_value(value):
+	if isinstance(value, (int, float)) and not isinstance(value, bool):
+		return str(value)
+	return frappe.db.escape(cstr(value))
+
+
+def encode_cursor(order, record):
+	cursor = {
+		"order": order,
+		"values": [record.get(fieldname) for fieldname, _direction in order],
+	}
+	return base64.urlsafe_b64encode(json.dumps(cursor, default=str).encode()).decode()
+
+
+def decode_cursor(cursor, order):
+	"""Decode `cursor` and return its key values, if it was built for `order`"""
+	try:
+		cursor = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+		values = cursor["values"]
+		cursor_order = [tuple(o) for o in cursor["order"]]
+	except Exception:
+		frappe.throw(_("Invalid cursor"))
+
+	if cursor_order != order or len(values) != len(order):
+		frappe.throw(_("Cursor does not match the current sort order"))
+
+	return values
+
+
+def is_valid_fieldname(doctype, fieldname):
+	return (
+		fieldname in default_fields
+		or fieldname in optional_fields
+		or frappe.get_meta(doctype).has_field(fieldname)
+	)
+
+
+def validate_fieldname(doctype, fieldname):
+	if not is_valid_fieldname(doctype, fieldname):
+		frappe.throw(_("Invalid field {0} for {1}").format(fieldname, doctype))
+
+
 def get_records_based_on_order(doctype, rows, filters, page_length, order):
 	records = []
 	filters = convert_filter_to_tuple(doctype, filters)
@@ -516,7 +922,7 @@ def get_fields_meta(doctype, restricted_fieldtypes=None, as_array=False):
 		restricted_fieldtypes = frappe.parse_json(restricted_fieldtypes)
 		not_allowed_fieldtypes += restricted_fieldtypes
 
-	fields = frappe.get_meta(doctype).fields
+	fields = get_field_descriptors(doctype)
 	fields = [field for field in fields if field.fieldtype not in not_allowed_fieldtypes]
 
 	standard_fields = [
@@ -571,7 +977,7 @@ def get_sidebar_fields(doctype, name):
 		"Column Break",
 	]
 
-	fields = frappe.get_meta(doctype).fields
+	fields = get_field_descriptors(doctype)
 	fields = [field for field in fields if field.fieldtype not in not_allowed_fieldtypes]
 
 	doc = frappe.get_cached_doc(doctype, name)
@@ -666,7 +1072,7 @@ def get_fields(doctype: str, allow_all_fieldtypes: bool = False):
 	not_allowed_fieldtypes = list(frappe.model.no_value_fields) + ["Read Only"]
 	if allow_all_fieldtypes:
 		not_allowed_fieldtypes = []
-	fields = frappe.get_meta(doctype).fields
+	fields = get_field_descriptors(doctype)
 
 	_fields = []
 
@@ -693,10 +1099,74 @@ def get_fields(doctype: str, allow_all_fieldtypes: bool = False):
 	return _fields
 
 
-def getCounts(d, doctype):
-	d["_email_count"] = frappe.db.count("Communication", filters={"reference_doctype": doctype, "reference_name": d.get("name"), "communication_type": "Communication"}) or 0
-	d["_email_count"] = d["_email_count"] + frappe.db.count("Communication", filters={"reference_doctype": doctype, "reference_name": d.get("name"), "communication_type": "Automated Message"})
-	d["_comment_count"] = frappe.db.count("Comment", filters={"reference_doctype": doctype, "reference_name": d.get("name"), "comment_type": "Comment"})
-	d["_task_count"] = frappe.db.count("CRM Task", filters={"reference_doctype": doctype, "reference_docname": d.get("name")})
-	d["_note_count"] = frappe.db.count("FCRM Note", filters={"reference_doctype": doctype, "reference_docname": d.get("name")})
-	return d
\ No newline at end of file
+def set_activity_counts(records, doctype):
+	"""
+	Set `_email_count`, `_comment_count`, `_task_count` and `_note_count` on
+	each of the `records` using one grouped query per source table
+	"""
+	names = list({d.get("name") for d in records if d.get("name")})
+	counts = get_activity_counts(doctype, names)
+	for d in records:
+		d.update(counts.get(d.get("name")) or get_empty_activity_counts())
+	return records
+
+
+def get_activity_counts(doctype, names):
+	"""
+	Get activity counts of the given documents
+
+	:param doctype: Reference doctype of the documents
+	:param names: Names of the documents
+	:return: Dict of counts keyed by document name
+	"""
+	counts = {name: get_empty_activity_counts() for name in names}
+	if not names:
+		return counts
+
+	Communication = frappe.qb.DocType("Communication")
+	Comment = frappe.qb.DocType("Comment")
+	Task = frappe.qb.DocType("CRM Task")
+	Note = frappe.qb.DocType("FCRM Note")
+
+	sources = [
+		(
+			"_email_count",
+			Communication,
+			Communication.reference_name,
+			[
+				Communication.reference_doctype == doctype,
+				Communication.communication_type.isin(["Communication", "Automated Message"]),
+			],
+		),
+		(
+			"_comment_count",
+			Comment,
+			Comment.reference_name,
+			[Comment.reference_doctype == doctype, Comment.comment_type == "Comment"],
+		),
+		("_task_count", Task, Task.reference_docname, [Task.reference_doctype == doctype]),
+		("_note_count", Note, Note.reference_docname, [Note.reference_doctype == doctype]),
+	]
+
+	for key, table, reference_field, conditions in sources:
+		query = (
+			frappe.qb.from_(table)
+			.select(reference_field.as_("reference_name"), Count("*").as_("count"))
+			.where(reference_field.isin(names))
+			.where(Criterion.all(conditions))
+			.groupby(reference_field)
+		)
+		for row in query.run(as_dict=True):
+			if row.reference_name in counts:
+				counts[row.reference_name][key] = row.count
+
+	return counts
+
+
+def get_empty_activity_counts():
+	return {
+		"_email_count": 0,
+		"_comment_count": 0,
+		"_task_count": 0,
+		"_note_count": 0,
+	}
@@ -0,0 +1,52 @@
+import frappe
+from frappe.utils import cint
+
+# bump when the shape of the cached descriptors changes
+FIELD_DESCRIPTORS_VERSION = 1
+
+
+def get_field_descriptors(doctype: str) -> list[frappe._dict]:
+	"""
+	Get the fields of `doctype` as plain dicts
+
+	Descriptors are built once from `frappe.get_meta` and kept in redis until
+	the doctype, one of its custom fields or property setters changes. Every
+	call returns fresh copies, so callers may modify them without touching the
+	shared meta or each other's results.
+
+	:param doctype: DocType to get fields of
+	:return: List of field descriptors in field order
+	"""
+	cache_key = get_field_descriptors_cache_key()
+	descriptors = frappe.cache.hget(cache_key, doctype)
+	if descriptors is None:
+		descriptors = build_field_descriptors(doctype)
+		frappe.cache.hset(cache_key, doctype, descriptors)
+
+	return [frappe._dict(descriptor) for descriptor in descriptors]
+
+
+def build_field_descriptors(doctype: str) -> list[dict]:
+	descriptors = []
+	for field in frappe.get_meta(doctype).fields:
+		descriptor = field.as_dict()
+		descriptor["is_custom_field"] = cint(field.get("is_custom_field"))
+		descriptors.append(descriptor)
+	return descriptors
+
+
+def get_field_descriptors_cache_key():
+	return f"crm_field_descriptors:v{FIELD_DESCRIPTORS_VERSION}"
+
+
+def clear_field_descriptors_cache(doc, method=None):
+	"""Drop cached descriptors of the doctype changed by a DocType, Custom Field or Property Setter"""
+	if doc.doctype == "DocType":
+		doctype = doc.name
+	elif doc.doctype == "Custom Field":
+		doctype = doc.dt
+	else:
+		doctype = doc.doc_type
+
+	if doctype:
+		frappe.cache.hdel(get_field_descriptors_cache_key(), doctype)
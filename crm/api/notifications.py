@@ -1,63 +1,152 @@
+import base64
+import json
+
 import frappe
+from frappe import _
 from frappe.query_builder import Order
+from frappe.utils import cint, now
+from crm.utils.realtime import publish
+
+
+NOTIFICATIONS_PAGE_LENGTH = 20
 
 
 @frappe.whitelist()
 def get_notifications():
+    notifications = get_notifications_query().run(as_dict=True)
+    return [format_notification(notification) for notification in notifications]
+
+
+@frappe.whitelist()
+def get_notifications_page(cursor=None, page_length=NOTIFICATIONS_PAGE_LENGTH):
+    """
+    Get one page of the session user's notifications, newest first
+
+    :param cursor: `next_cursor` of the previous page
+    :param page_length: Number of notifications to return
+    :return: `notifications` and the `next_cursor` of the next page, if any
+    """
     Notification = frappe.qb.DocType("CRM Notification")
-    query = (
+    page_length = max(cint(page_length), 1)
+    query = get_notifications_query().limit(page_length + 1)
+    if cursor:
+        creation, name = decode_cursor(cursor)
+        query = query.where(
+            (Notification.creation < creation)
+            | ((Notification.creation == creation) & (Notification.name < name))
+        )
+
+    notifications = query.run(as_dict=True)
+    next_cursor = None
+    if len(notifications) > page_length:
+        notifications = notifications[:page_length]
+        last = notifications[-1]
+        next_cursor = encode_cursor([str(last.creation), last.name])
+
+    return {
+        "notifications": [format_notification(n) for n in notifications],
+        "next_cursor": next_cursor,
+    }
+
+
+@frappe.whitelist()
+def get_unread_count():
+    """Count the session user's unread notifications, from the (to_user, read, creation) index"""
+    return frappe.db.count(
+        "CRM Notification", {"to_user": frappe.session.user, "read": 0}
+    )
+
+
+def get_notifications_query():
+    Notification = frappe.qb.DocType("CRM Notification")
+    User = frappe.qb.DocType("User")
+    return (
         frappe.qb.from_(Notification)
-        .select("*")
+        .left_join(User)
+        .on(User.name == Notification.from_user)
+        .select(
+            Notification.name,
+            Notification.creation,
+            Notification.from_user,
+            User.full_name.as_("from_user_full_name"),
+            Notification.type,
+            Notification.to_user,
+            Notification.read,
+            Notification.message,
+            Notification.notification_text,
+            Notification.notification_type_doctype,
+            Notification.notification_type_doc,
+            Notification.reference_doctype,
+            Notification.reference_name,
+        )
         .where(Notification.to_user == frappe.session.user)
-        .orderby("creation", order=Order.desc)
+        .orderby(Notification.creation, order=Order.desc)
+        .orderby(Notification.name, order=Order.desc)
     )
-    notifications = query.run(as_dict=True)
 
-    _notifications = []
-    for notification in notifications:
-        _notifications.append(
-            {
-                "creation": notification.creation,
-                "from_user": {
-                    "name": notification.from_user,
-                    "full_name": frappe.get_value(
-                        "User", notification.from_user, "full_name"
-                    ),
-                },
-                "type": notification.type,
-                "to_user": notification.to_user,
-                "read": notification.read,
-                "hash": get_hash(notification),
-                "notification_text": notification.notification_text,
-                "notification_type_doctype": notification.notification_type_doctype,
-                "notification_type_doc": notification.notification_type_doc,
-                "reference_doctype": (
-                    "deal" if notification.reference_doctype == "CRM Deal" else "lead"
-                ),
-                "reference_name": notification.reference_name,
-                "route_name": (
-                    "Deal" if notification.reference_doctype == "CRM Deal" else "Lead"
-                ),
-            }
-        )
 
-    return _notifications
+def format_notification(notification):
+    return {
+        "name": notification.name,
+        "creation": notification.creation,
+        "from_user": {
+            "name": notification.from_user,
+            "full_name": notification.from_user_full_name,
+        },
+        "type": notification.type,
+        "to_user": notification.to_user,
+        "read": notification.read,
+        "hash": get_hash(notification),
+        "notification_text": notification.notification_text,
+        "notification_type_doctype": notification.notification_type_doctype,
+        "notification_type_doc": notification.notification_type_doc,
+        "reference_doctype": (
+            "deal" if notification.reference_doctype == "CRM Deal" else "lead"
+        ),
+        "reference_name": notification.reference_name,
+        "route_name": (
+            "Deal" if notification.reference_doctype == "CRM Deal" else "Lead"
+        ),
+    }
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        creation, name = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        frappe.throw(_("Invalid cursor"))
+    return creation, name
 
 
 @frappe.whitelist()
 def mark_as_read(user=None, doc=None):
+    """
+    Mark unread notifications of `user` as read, only those of `doc` if given,
+    with one UPDATE and one realtime event
+    """
     user = user or frappe.session.user
-    filters = {"to_user": user, "read": False}
-    or_filters = []
+    frappe.has_permission("CRM Notification", "write", throw=True)
+
+    Notification = frappe.qb.DocType("CRM Notification")
+    query = (
+        frappe.qb.update(Notification)
+        .set(Notification.read, 1)
+        .set(Notification.modified, now())
+        .where(Notification.to_user == user)
+        .where(Notification.read == 0)
+    )
     if doc:
-        or_filters = [
-            {"comment": doc},
-            {"notification_type_doc": doc},
-        ]
-    for n in frappe.get_all("CRM Notification", filters=filters, or_filters=or_filters):
-        d = frappe.get_doc("CRM Notification", n.name)
-        d.read = True
-        d.save()
+        query = query.where(
+            (Notification.comment == doc) | (Notification.notification_type_doc == doc)
+        )
+    query.run()
+
+    publish("crm_notification", user=user)
+
 
 def get_hash(notification):
     _hash = ""
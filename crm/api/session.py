@@ -1,8 +1,22 @@
 import frappe
 
+USERS_CACHE_KEY = "crm_users"
+
 
 @frappe.whitelist()
 def get_users():
+	users = frappe.cache.get_value(USERS_CACHE_KEY)
+	if users is None:
+		users = get_user_directory()
+		frappe.cache.set_value(USERS_CACHE_KEY, users)
+
+	users = [frappe._dict(user) for user in users]
+	for user in users:
+		if frappe.session.user == user.name:
+			user.session_user = True
+	return users
+
+def get_user_directory():
 	users = frappe.qb.get_query(
 		"User",
 		fields=["name", "email", "enabled", "user_image", "first_name", "last_name", "full_name", "user_type"],
@@ -10,15 +24,20 @@ def get_users():
 		distinct=True,
 	).run(as_dict=1)
 
-	for user in users:
-		if frappe.session.user == user.name:
-			user.session_user = True
-
-		user.is_manager = (
-			"Sales Manager" in frappe.get_roles(user.name) or user.name == "Administrator"
+	managers = set(
+		frappe.get_all(
+			"Has Role",
+			filters={"parenttype": "User", "role": "Sales Manager"},
+			pluck="parent",
 		)
+	)
+	for user in users:
+		user.is_manager = user.name in managers or user.name == "Administrator"
 	return users
 
+def clear_users_cache(doc=None, method=None):
+	frappe.cache.delete_value(USERS_CACHE_KEY)
+
 @frappe.whitelist()
 def get_contacts():
 	contacts = frappe.get_all(
@@ -1,8 +1,36 @@
 import frappe
 import json
 from frappe import _
+from frappe.query_builder import Order
+from frappe.utils import cint, cstr, get_datetime
+from frappe.utils.caching import request_cache
+from pypika import Criterion
 from crm.api.doc import get_assigned_users
 from crm.fcrm.doctype.crm_notification.crm_notification import notify_user
+from crm.utils import get_lead_or_deal_from_number
+from crm.utils.realtime import publish
+
+MESSAGE_FIELDS = [
+    "name",
+    "type",
+    "to",
+    "from",
+    "content_type",
+    "message_type",
+    "attach",
+    "template",
+    "use_template",
+    "message_id",
+    "is_reply",
+    "reply_to_message_id",
+    "creation",
+    "message",
+    "status",
+    "reference_doctype",
+    "reference_name",
+    "template_parameters",
+    "template_header_parameters",
+]
 
 
 def validate(doc, method):
@@ -13,12 +41,14 @@ def validate(doc, method):
 
 
 def on_update(doc, method):
-    frappe.publish_realtime(
+    publish(
         "whatsapp_message",
         {
             "reference_doctype": doc.reference_doctype,
             "reference_name": doc.reference_name,
         },
+        doctype=doc.reference_doctype,
+        docname=doc.reference_name,
     )
 
     notify_agent(doc)
@@ -53,41 +83,6 @@ def notify_agent(doc):
             )
 
 
-def get_lead_or_deal_from_number(number):
-    """Get lead/deal from the given number."""
-
-    def find_record(doctype, mobile_no, where=""):
-        mobile_no = parse_mobile_no(mobile_no)
-
-        query = f"""
-            SELECT name, mobile_no
-            FROM `tab{doctype}`
-            WHERE CONCAT('+', REGEXP_REPLACE(mobile_no, '[^0-9]', '')) = {mobile_no}
-        """
-
-        data = frappe.db.sql(query + where, as_dict=True)
-        return data[0].name if data else None
-
-    doctype = "CRM Deal"
-
-    doc = find_record(doctype, number) or None
-    if not doc:
-        doctype = "CRM Lead"
-        doc = find_record(doctype, number, "AND converted is not True")
-        if not doc:
-            doc = find_record(doctype, number)
-
-    return doc, doctype
-
-
-def parse_mobile_no(mobile_no: str):
-    """Parse mobile number to remove spaces, brackets, etc.
-    >>> parse_mobile_no('+91 (766) 667 6666')
-    ... '+917666676666'
-    """
-    return "".join([c for c in mobile_no if c.isdigit() or c == "+"])
-
-
 @frappe.whitelist()
 def is_whatsapp_enabled():
     if not frappe.db.exists("DocType", "WhatsApp Settings"):
@@ -103,157 +98,175 @@ def is_whatsapp_installed():
 
 
 @frappe.whitelist()
-def get_whatsapp_messages(reference_doctype, reference_name):
+def get_whatsapp_messages(
+    reference_doctype, reference_name, page_length=None, before=None, before_name=None
+):
+    """
+    Get the WhatsApp messages of a lead or deal, oldest first.
+
+    Messages of the lead a deal was converted from are included. With
+    `page_length`, only that many of the newest messages before the
+    (`before`, `before_name`) creation and name of the oldest message loaded
+    are returned, so older ones can be loaded as the chat scrolls.
+    Reactions are attached to the messages they react to and not returned.
+    """
     if not frappe.db.exists("DocType", "WhatsApp Message"):
         return []
-    messages = []
 
+    references = [(reference_doctype, reference_name)]
     if reference_doctype == "CRM Deal":
         lead = frappe.db.get_value(reference_doctype, reference_name, "lead")
         if lead:
-            messages = frappe.get_all(
-                "WhatsApp Message",
-                filters={
-                    "reference_doctype": "CRM Lead",
-                    "reference_name": lead,
-                },
-                fields=[
-                    "name",
-                    "type",
-                    "to",
-                    "from",
-                    "content_type",
-                    "message_type",
-                    "attach",
-                    "template",
-                    "use_template",
-                    "message_id",
-                    "is_reply",
-                    "reply_to_message_id",
-                    "creation",
-                    "message",
-                    "status",
-                    "reference_doctype",
-                    "reference_name",
-                    "template_parameters",
-                    "template_header_parameters",
-                ],
+            references.append(("CRM Lead", lead))
+
+    Message = frappe.qb.DocType("WhatsApp Message")
+    in_chat = Criterion.any(
+        [
+            (Message.reference_doctype == doctype) & (Message.reference_name == name)
+            for doctype, name in references
+        ]
+    )
+    query = (
+        frappe.qb.from_(Message)
+        .select(*[Message[field] for field in MESSAGE_FIELDS])
+        .where(in_chat)
+        .where(Message.content_type.isnull() | (Message.content_type != "reaction"))
+    )
+    if before:
+        before = get_datetime(before)
+        if before_name:
+            query = query.where(
+                (Message.creation < before)
+                | ((Message.creation == before) & (Message.name < before_name))
             )
+        else:
+            query = query.where(Message.creation < before)
+    if page_length:
+        query = (
+            query.orderby(Message.creation, order=Order.desc)
+            .orderby(Message.name, order=Order.desc)
+            .limit(cint(page_length))
+        )
+    else:
+        query = query.orderby(Message.creation).orderby(Message.name)
+    messages = query.run(as_dict=True)
+    if page_length:
+        messages.reverse()
 
-    messages += frappe.get_all(
-        "WhatsApp Message",
-        filters={
-            "reference_doctype": reference_doctype,
-            "reference_name": reference_name,
-        },
-        fields=[
-            "name",
-            "type",
-            "to",
-            "from",
-            "content_type",
-            "message_type",
-            "attach",
-            "template",
-            "use_template",
-            "message_id",
-            "is_reply",
-            "reply_to_message_id",
-            "creation",
-            "message",
-            "status",
-            "reference_doctype",
-            "reference_name",
-            "template_parameters",
-            "template_header_parameters",
-        ],
-    )
+    messages_by_id = {m["message_id"]: m for m in messages if m["message_id"]}
 
-    # Filter messages to get only Template messages
+    set_template_details(messages)
+    set_reactions(messages_by_id, in_chat)
+
+    for message in messages:
+        from_name = get_from_name(message) if message["from"] else _("You")
+        message["from_name"] = from_name
+
+    set_reply_details(messages, messages_by_id, in_chat)
+
+    return messages
+
+
+def set_template_details(messages):
+    """Add template name, body, header and footer to template messages, with one query"""
     template_messages = [
         message for message in messages if message["message_type"] == "Template"
     ]
-
-    # Iterate through template messages
-    for template_message in template_messages:
-        # Find the template that this message is using
-        template = frappe.get_doc("WhatsApp Templates", template_message["template"])
-
-        # If the template is found, add the template details to the template message
-        if template:
-            template_message["template_name"] = template.template_name
-            if template_message["template_parameters"]:
-                parameters = json.loads(template_message["template_parameters"])
-                template.template = parse_template_parameters(
-                    template.template, parameters
-                )
-
-            template_message["template"] = template.template
-            if template_message["template_header_parameters"]:
-                header_parameters = json.loads(
-                    template_message["template_header_parameters"]
-                )
-                template.header = parse_template_parameters(
-                    template.header, header_parameters
-                )
-            template_message["header"] = template.header
-            template_message["footer"] = template.footer
-
-    # Filter messages to get only reaction messages
-    reaction_messages = [
-        message for message in messages if message["content_type"] == "reaction"
-    ]
-
-    # Iterate through reaction messages
-    for reaction_message in reaction_messages:
-        # Find the message that this reaction is reacting to
-        reacted_message = next(
-            (
-                m
-                for m in messages
-                if m["message_id"] == reaction_message["reply_to_message_id"]
-            ),
-            None,
+    if not template_messages:
+        return
+
+    templates = {
+        template.name: template
+        for template in frappe.get_all(
+            "WhatsApp Templates",
+            filters={"name": ["in", list({m["template"] for m in template_messages})]},
+            fields=["name", "template_name", "template", "header", "footer"],
         )
+    }
 
-        # If the reacted message is found, add the reaction to it
-        if reacted_message:
-            reacted_message["reaction"] = reaction_message["message"]
-
-    for message in messages:
-        from_name = get_from_name(message) if message["from"] else _("You")
-        message["from_name"] = from_name
-    # Filter messages to get only replies
+    for template_message in template_messages:
+        template = templates.get(template_message["template"])
+        if not template:
+            continue
+
+        template_message["template_name"] = template.template_name
+        body = template.template
+        if template_message["template_parameters"]:
+            parameters = json.loads(template_message["template_parameters"])
+            body = parse_template_parameters(body, parameters)
+        template_message["template"] = body
+
+        header = template.header
+        if template_message["template_header_parameters"]:
+            header_parameters = json.loads(template_message["template_header_parameters"])
+            header = parse_template_parameters(header, header_parameters)
+        template_message["header"] = header
+        template_message["footer"] = template.footer
+
+
+def set_reactions(messages_by_id, in_chat):
+    """
+    Add the latest reaction to each message, with one query over the
+    messages of the chat, `in_chat`
+    """
+    if not messages_by_id:
+        return
+
+    Message = frappe.qb.DocType("WhatsApp Message")
+    reactions = (
+        frappe.qb.from_(Message)
+        .select(Message.reply_to_message_id, Message.message)
+        .where(in_chat)
+        .where(Message.content_type == "reaction")
+        .where(Message.reply_to_message_id.isin(list(messages_by_id)))
+        .orderby(Message.creation)
+        .orderby(Message.name)
+    ).run(as_dict=True)
+    for reaction in reactions:
+        messages_by_id[reaction.reply_to_message_id]["reaction"] = reaction.message
+
+
+def set_reply_details(messages, messages_by_id, in_chat):
+    """
+    Add the message each reply replies to. Replied messages outside `messages`,
+    like ones on an older page, are fetched with one query over the messages
+    of the chat, `in_chat`.
+    """
     reply_messages = [message for message in messages if message["is_reply"]]
+    missing = {
+        m["reply_to_message_id"]
+        for m in reply_messages
+        if m["reply_to_message_id"] and m["reply_to_message_id"] not in messages_by_id
+    }
+    replied_messages = dict(messages_by_id)
+    if missing:
+        Message = frappe.qb.DocType("WhatsApp Message")
+        older = (
+            frappe.qb.from_(Message)
+            .select(*[Message[field] for field in MESSAGE_FIELDS])
+            .where(in_chat)
+            .where(Message.message_id.isin(list(missing)))
+        ).run(as_dict=True)
+        set_template_details(older)
+        replied_messages.update({m["message_id"]: m for m in older})
 
-    # Iterate through reply messages
     for reply_message in reply_messages:
-        # Find the message that this message is replying to
-        replied_message = next(
-            (
-                m
-                for m in messages
-                if m["message_id"] == reply_message["reply_to_message_id"]
-            ),
-            None,
-        )
+        replied_message = replied_messages.get(reply_message["reply_to_message_id"])
+        if not replied_message:
+            continue
 
-        # If the replied message is found, add the reply details to the reply message
         from_name = (
             get_from_name(reply_message) if replied_message["from"] else _("You")
         )
-        if replied_message:
-            message = replied_message["message"]
-            if replied_message["message_type"] == "Template":
-                message = replied_message["template"]
-            reply_message["reply_message"] = message
-            reply_message["header"] = replied_message.get("header") or ""
-            reply_message["footer"] = replied_message.get("footer") or ""
-            reply_message["reply_to"] = replied_message["name"]
-            reply_message["reply_to_type"] = replied_message["type"]
-            reply_message["reply_to_from"] = from_name
-
-    return [message for message in messages if message["content_type"] != "reaction"]
+        message = replied_message["message"]
+        if replied_message["message_type"] == "Template":
+            message = replied_message["template"]
+        reply_message["reply_message"] = message
+        reply_message["header"] = replied_message.get("header") or ""
+        reply_message["footer"] = replied_message.get("footer") or ""
+        reply_message["reply_to"] = replied_message["name"]
+        reply_message["reply_to_type"] = replied_message["type"]
+        reply_message["reply_to_from"] = from_name
 
 
 @frappe.whitelist()
@@ -338,16 +351,31 @@ def parse_template_parameters(string, parameters):
 
 
 def get_from_name(message):
-    doc = frappe.get_doc(message["reference_doctype"], message["reference_name"])
-    from_name = ""
-    if message["reference_doctype"] == "CRM Deal":
-        if doc.get("contacts"):
-            for c in doc.get("contacts"):
-                if c.is_primary:
-                    from_name = c.full_name or c.mobile_no
-                    break
-        else:
-            from_name = doc.get("lead_name")
-    else:
-        from_name = doc.get("first_name") + " " + doc.get("last_name")
-    return from_name
+    return get_reference_name(message["reference_doctype"], message["reference_name"])
+
+
+@request_cache
+def get_reference_name(doctype, name):
+    """
+    Get the display name of the lead or deal a message belongs to. Cached for
+    the request, since a chat only has one or two references.
+    """
+    if not doctype or not name:
+        return ""
+
+    if doctype == "CRM Deal":
+        contacts = frappe.get_all(
+            "CRM Contacts",
+            filters={"parenttype": "CRM Deal", "parent": name},
+            fields=["full_name", "mobile_no", "is_primary"],
+            order_by="idx asc",
+        )
+        if not contacts:
+            return frappe.db.get_value("CRM Deal", name, "lead_name")
+        for c in contacts:
+            if c.is_primary:
+                return c.full_name or c.mobile_no
+        return ""
+
+    first_name, last_name = frappe.db.get_value(doctype, name, ["first_name", "last_name"])
+    return cstr(first_name) + " " + cstr(last_name)
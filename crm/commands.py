@@ -0,0 +1,48 @@
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("recompute-sla")
+@click.argument("sla", required=False)
+@click.option("--chunk-size", type=int, default=1000, help="Documents read and updated at a time")
+@pass_context
+def recompute_sla(context, sla=None, chunk_size=1000):
+	"""Recompute SLA fields of leads and deals, for one SLA or all of them"""
+	import frappe
+	from crm.fcrm.doctype.crm_service_level_agreement.recompute import recompute_sla_fields
+
+	def progress(doctype, done, total, rate):
+		click.echo(f"{doctype}: {done}/{total} ({rate:.0f} per second)")
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		slas = [sla] if sla else frappe.get_all("CRM Service Level Agreement", pluck="name")
+		for name in slas:
+			click.echo(f"Recomputing {name}")
+			updated = recompute_sla_fields(name, chunk_size, progress=progress)
+			click.echo(f"Updated {updated} documents")
+	finally:
+		frappe.destroy()
+
+
+@click.command("backfill-crm-activities")
+@click.option("--chunk-size", type=int, default=1000, help="Source documents read at a time")
+@pass_context
+def backfill_crm_activities(context, chunk_size=1000):
+	"""Rebuild the CRM Activity timeline rows from existing history"""
+	import frappe
+	from crm.fcrm.doctype.crm_activity.crm_activity import backfill_activities
+
+	def progress(doctype, written):
+		click.echo(f"{doctype}: {written} activities")
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		backfill_activities(chunk_size, progress=progress)
+	finally:
+		frappe.destroy()
+
+
+commands = [recompute_sla, backfill_crm_activities]
@@ -0,0 +1,187 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+import json
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import markdown, now
+
+from crm.api.activities import (
+	ATTACHMENT_FIELDS,
+	AVOID_FIELDS,
+	CALL_FIELDS,
+	NOTE_FIELDS,
+	TASK_FIELDS,
+	get_attachment_log_activity,
+	get_comment_activity,
+	get_communication_activity,
+	get_timeline_fields,
+	get_version_activity,
+)
+
+TIMELINE_DOCTYPES = ["CRM Lead", "CRM Deal"]
+
+# doctypes that add to the timeline, with the fields linking them to a lead or deal
+ACTIVITY_SOURCES = {
+	"Version": ("ref_doctype", "docname"),
+	"Comment": ("reference_doctype", "reference_name"),
+	"Communication": ("reference_doctype", "reference_name"),
+	"File": ("attached_to_doctype", "attached_to_name"),
+	"CRM Call Log": ("reference_doctype", "reference_docname"),
+	"FCRM Note": ("reference_doctype", "reference_docname"),
+	"CRM Task": ("reference_doctype", "reference_docname"),
+}
+
+ACTIVITY_COLUMNS = [
+	"name",
+	"creation",
+	"modified",
+	"owner",
+	"modified_by",
+	"reference_doctype",
+	"reference_name",
+	"activity_type",
+	"source_doctype",
+	"source_name",
+	"data",
+]
+
+BACKFILL_CHUNK_SIZE = 1000
+
+
+class CRMActivity(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("CRM Activity", ["reference_doctype", "reference_name", "creation"])
+	frappe.db.add_index("CRM Activity", ["source_doctype", "source_name"])
+
+
+def update_activity(doc, method=None):
+	"""Write the CRM Activity row of `doc`, replacing the one written before"""
+	row = get_activity_row(doc.doctype, doc.as_dict())
+	previous = doc.get_doc_before_save()
+	if row or (previous and is_timeline_reference(doc.doctype, previous)):
+		delete_activity(doc)
+	if row:
+		frappe.db.bulk_insert("CRM Activity", ACTIVITY_COLUMNS, [row])
+
+
+def delete_activity(doc, method=None):
+	if is_timeline_reference(doc.doctype, doc):
+		frappe.db.delete("CRM Activity", {"source_doctype": doc.doctype, "source_name": doc.name})
+
+
+def delete_reference_activities(doc, method=None):
+	"""Delete the activities of a lead or deal being deleted"""
+	frappe.db.delete("CRM Activity", {"reference_doctype": doc.doctype, "reference_name": doc.name})
+
+
+def is_timeline_reference(doctype, source):
+	doctype_field, name_field = ACTIVITY_SOURCES[doctype]
+	return source.get(doctype_field) in TIMELINE_DOCTYPES and bool(source.get(name_field))
+
+
+def get_activity_row(doctype, source):
+	"""
+	Get the CRM Activity row of `source`, a document or a row of `doctype`, as
+	values of `ACTIVITY_COLUMNS`
+
+	:return: Row, or None if `source` is not an activity of a lead or deal
+	"""
+	if not is_timeline_reference(doctype, source):
+		return None
+
+	doctype_field, name_field = ACTIVITY_SOURCES[doctype]
+	reference_doctype = source.get(doctype_field)
+	reference_name = source.get(name_field)
+
+	activity = get_activity(doctype, source, reference_doctype)
+	if not activity:
+		return None
+
+	activity_type, data = activity
+	return (
+		frappe.generate_hash(length=10),
+		source.creation,
+		now(),
+		source.owner,
+		frappe.session.user,
+		reference_doctype,
+		reference_name,
+		activity_type,
+		doctype,
+		source.name,
+		json.dumps(data, default=str),
+	)
+
+
+def get_activity(doctype, source, reference_doctype):
+	"""Get activity type and data of `source`, built the way the timeline shows it"""
+	is_lead = reference_doctype == "CRM Lead"
+
+	if doctype == "Version":
+		activity = get_version_activity(
+			source, get_timeline_fields(reference_doctype), AVOID_FIELDS[reference_doctype], is_lead
+		)
+	elif doctype == "Comment" and source.comment_type == "Comment":
+		activity = get_comment_activity(
+			frappe._dict(
+				name=source.name,
+				creation=source.creation,
+				owner=source.owner,
+				content=markdown(source.content),
+			),
+			is_lead,
+		)
+	elif doctype == "Comment" and source.comment_type in ["Attachment", "Attachment Removed"]:
+		activity = get_attachment_log_activity(source, is_lead)
+	elif doctype == "Communication" and source.communication_type in ["Communication", "Automated Message"]:
+		activity = get_communication_activity(source, is_lead)
+	elif doctype == "File":
+		return "attachment", {field: source.get(field) for field in ATTACHMENT_FIELDS}
+	elif doctype == "CRM Call Log":
+		return "call", {field: source.get(field) for field in CALL_FIELDS}
+	elif doctype == "FCRM Note":
+		return "note", {field: source.get(field) for field in NOTE_FIELDS}
+	elif doctype == "CRM Task":
+		return "task", {field: source.get(field) for field in TASK_FIELDS}
+	else:
+		return None
+
+	if activity:
+		return activity["activity_type"], activity
+
+
+def backfill_activities(chunk_size=BACKFILL_CHUNK_SIZE, progress=None):
+	"""
+	Rebuild all CRM Activity rows from the existing history of leads and deals
+
+	:param progress: Called with source doctype and rows written so far after each chunk
+	"""
+	for doctype, (doctype_field, _name_field) in ACTIVITY_SOURCES.items():
+		frappe.db.delete("CRM Activity", {"source_doctype": doctype})
+		written = 0
+		last_name = ""
+		while True:
+			sources = frappe.get_all(
+				doctype,
+				filters={doctype_field: ["in", TIMELINE_DOCTYPES], "name": [">", last_name]},
+				fields=["*"],
+				order_by="name asc",
+				limit=chunk_size,
+			)
+			if not sources:
+				break
+
+			rows = [row for source in sources if (row := get_activity_row(doctype, source))]
+			if rows:
+				frappe.db.bulk_insert("CRM Activity", ACTIVITY_COLUMNS, rows)
+			frappe.db.commit()
+
+			written += len(rows)
+			last_name = sources[-1].name
+			if progress:
+				progress(doctype, written)
@@ -0,0 +1,79 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase, UnitTestCase
+
+from crm.api.activities import get_activities, get_activities_page
+from crm.fcrm.doctype.crm_call_log.crm_call_log import create_lead_from_call_log
+from crm.integrations.twilio.api import update_recording_info
+
+
+class TestCRMActivity(UnitTestCase):
+	pass
+
+
+class IntegrationTestCRMActivity(IntegrationTestCase):
+	def setUp(self):
+		self.lead = frappe.get_doc({"doctype": "CRM Lead", "first_name": "Timeline Test"}).insert()
+
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def make_call_log(self, **values):
+		return frappe.get_doc(
+			{
+				"doctype": "CRM Call Log",
+				"id": frappe.generate_hash(length=10),
+				"type": "Incoming",
+				"status": "Completed",
+				"from": "+15550100",
+				"to": "+15550101",
+				**values,
+			}
+		).insert()
+
+	def get_calls(self, name):
+		_activities, calls, _notes, _tasks, _attachments = get_activities(name)
+		return {call["name"]: call for call in calls}
+
+	def test_recording_url_reaches_timeline(self):
+		call_log = self.make_call_log(reference_doctype="CRM Lead", reference_docname=self.lead.name)
+		self.assertIsNone(self.get_calls(self.lead.name)[call_log.name]["recording_url"])
+
+		update_recording_info(CallSid=call_log.name, RecordingUrl="https://example.com/recording.mp3")
+
+		call = self.get_calls(self.lead.name)[call_log.name]
+		self.assertEqual(call["recording_url"], "https://example.com/recording.mp3")
+
+	def test_call_moves_to_lead_created_from_it(self):
+		call_log = self.make_call_log()
+
+		lead_name = create_lead_from_call_log(call_log.as_dict())
+
+		self.assertIn(call_log.name, self.get_calls(lead_name))
+
+	def test_timeline_pages_match_whole_timeline(self):
+		for i in range(5):
+			self.lead.add_comment("Comment", f"Comment {i}")
+		self.lead.reload()
+		self.lead.status = "Contacted"
+		self.lead.save()
+
+		timeline, *_linked = get_activities(self.lead.name)
+		paged, cursor = [], None
+		while True:
+			page = get_activities_page(self.lead.name, cursor=cursor, page_length=2)
+			paged.extend(page["activities"])
+			if not (cursor := page["cursor"]):
+				break
+
+		self.assertEqual(frappe.as_json(paged), frappe.as_json(timeline))
+
+	def test_linked_activities_without_timeline(self):
+		call_log = self.make_call_log(reference_doctype="CRM Lead", reference_docname=self.lead.name)
+
+		timeline, calls, _notes, _tasks, _attachments = get_activities(self.lead.name, timeline=False)
+
+		self.assertEqual(timeline, [])
+		self.assertIn(call_log.name, [call["name"] for call in calls])
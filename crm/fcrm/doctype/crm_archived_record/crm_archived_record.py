@@ -0,0 +1,116 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+import base64
+import json
+import zlib
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_days, cint, now, now_datetime
+
+from crm.fcrm.doctype.crm_activity.crm_activity import ACTIVITY_SOURCES
+
+ARCHIVE_CHUNK_SIZE = 1000
+ARCHIVE_COLUMNS = [
+	"name",
+	"creation",
+	"modified",
+	"owner",
+	"modified_by",
+	"archived_doctype",
+	"archived_name",
+	"archived_creation",
+	"data",
+]
+
+
+class CRMArchivedRecord(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("CRM Archived Record", ["archived_doctype", "archived_name"])
+
+
+def archive_old_records():
+	"""
+	Move read notifications and call logs older than the retention days set in
+	FCRM Settings to CRM Archived Record
+	"""
+	settings = frappe.get_cached_doc("FCRM Settings")
+
+	if days := cint(settings.archive_notifications_after):
+		archive_documents(
+			"CRM Notification",
+			{"read": 1, "creation": ["<", add_days(now_datetime(), -days)]},
+		)
+
+	if days := cint(settings.archive_call_logs_after):
+		archive_documents("CRM Call Log", {"creation": ["<", add_days(now_datetime(), -days)]})
+
+
+def archive_documents(doctype, filters, chunk_size=ARCHIVE_CHUNK_SIZE):
+	"""
+	Move the documents of `doctype` matching `filters` to CRM Archived Record,
+	`chunk_size` documents at a time, committing after each chunk
+
+	Documents are deleted without loading them, so no hooks run for them. Their
+	CRM Activity rows are deleted along with them, taking them off the timeline.
+
+	:return: Number of documents archived
+	"""
+	archived = 0
+	while True:
+		rows = frappe.get_all(doctype, filters=filters, fields=["*"], order_by="creation asc", limit=chunk_size)
+		if not rows:
+			break
+
+		timestamp = now()
+		frappe.db.bulk_insert(
+			"CRM Archived Record",
+			ARCHIVE_COLUMNS,
+			[
+				(
+					frappe.generate_hash(length=10),
+					timestamp,
+					timestamp,
+					frappe.session.user,
+					frappe.session.user,
+					doctype,
+					row.name,
+					row.creation,
+					compress(row),
+				)
+				for row in rows
+			],
+		)
+		names = [row.name for row in rows]
+		frappe.db.delete(doctype, {"name": ["in", names]})
+		if doctype in ACTIVITY_SOURCES:
+			# the timeline opens its activities by name, so they go with the documents
+			frappe.db.delete("CRM Activity", {"source_doctype": doctype, "source_name": ["in", names]})
+		frappe.db.commit()
+
+		archived += len(rows)
+		if len(rows) < chunk_size:
+			break
+
+	return archived
+
+
+def get_archived_document(doctype, name):
+	"""Get the archived values of document `name` of `doctype`, or None"""
+	data = frappe.db.get_value(
+		"CRM Archived Record", {"archived_doctype": doctype, "archived_name": name}, "data"
+	)
+	return decompress(data) if data else None
+
+
+def compress(row):
+	data = json.dumps(row, default=str, separators=(",", ":")).encode()
+	return base64.b64encode(zlib.compress(data)).decode()
+
+
+def decompress(data):
+	return frappe._dict(json.loads(zlib.decompress(base64.b64decode(data))))
@@ -0,0 +1,127 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase, UnitTestCase
+from frappe.utils import add_days, now_datetime
+
+from crm.fcrm.doctype.crm_archived_record.crm_archived_record import (
+	archive_documents,
+	archive_old_records,
+	compress,
+	decompress,
+	get_archived_document,
+)
+
+
+class TestCRMArchivedRecord(UnitTestCase):
+	def test_compress_round_trip(self):
+		row = frappe._dict(name="abc", read=1, creation=now_datetime(), message="<p>Hello ✓</p>")
+		data = compress(row)
+
+		self.assertIsInstance(data, str)
+		self.assertEqual(decompress(data), {**row, "creation": str(row.creation)})
+
+
+class IntegrationTestCRMArchivedRecord(IntegrationTestCase):
+	def setUp(self):
+		self.notifications = []
+		self.call_logs = []
+		self.leads = []
+
+	def tearDown(self):
+		# archiving commits, so clean up instead of rolling back
+		for doctype, names in [("CRM Notification", self.notifications), ("CRM Call Log", self.call_logs)]:
+			frappe.db.delete(doctype, {"name": ["in", names]})
+			frappe.db.delete("CRM Archived Record", {"archived_doctype": doctype, "archived_name": ["in", names]})
+		for lead in self.leads:
+			frappe.delete_doc("CRM Lead", lead, force=True)
+		self.set_retention(0, 0)
+		frappe.db.commit()
+
+	def set_retention(self, notifications, call_logs):
+		settings = frappe.get_single("FCRM Settings")
+		settings.archive_notifications_after = notifications
+		settings.archive_call_logs_after = call_logs
+		settings.save()
+
+	def make_notification(self, days_old, read=1):
+		notification = frappe.get_doc(
+			{
+				"doctype": "CRM Notification",
+				"from_user": "Administrator",
+				"to_user": "Administrator",
+				"type": "Mention",
+				"message": frappe.generate_hash(),
+				"read": read,
+			}
+		).insert()
+		frappe.db.set_value(
+			"CRM Notification",
+			notification.name,
+			"creation",
+			add_days(now_datetime(), -days_old),
+			update_modified=False,
+		)
+		self.notifications.append(notification.name)
+		return notification.name
+
+	def make_call_log(self, days_old, **values):
+		call_log = frappe.get_doc(
+			{
+				"doctype": "CRM Call Log",
+				"id": frappe.generate_hash(length=10),
+				"type": "Incoming",
+				"status": "Completed",
+				"from": "+15550100",
+				"to": "+15550101",
+				**values,
+			}
+		).insert()
+		frappe.db.set_value(
+			"CRM Call Log", call_log.name, "creation", add_days(now_datetime(), -days_old), update_modified=False
+		)
+		self.call_logs.append(call_log.name)
+		return call_log.name
+
+	def test_archive_in_chunks(self):
+		names = [self.make_notification(days_old=1) for _i in range(5)]
+
+		archived = archive_documents("CRM Notification", {"name": ["in", names]}, chunk_size=2)
+
+		self.assertEqual(archived, 5)
+		self.assertFalse(frappe.db.exists("CRM Notification", {"name": ["in", names]}))
+		for name in names:
+			self.assertEqual(get_archived_document("CRM Notification", name).name, name)
+
+	def test_retention_cutoff_and_read_filter(self):
+		old_read = self.make_notification(days_old=40)
+		old_unread = self.make_notification(days_old=40, read=0)
+		recent_read = self.make_notification(days_old=10)
+		old_call_log = self.make_call_log(days_old=40)
+		self.set_retention(30, 0)
+
+		archive_old_records()
+
+		self.assertFalse(frappe.db.exists("CRM Notification", old_read))
+		self.assertTrue(frappe.db.exists("CRM Notification", old_unread))
+		self.assertTrue(frappe.db.exists("CRM Notification", recent_read))
+		self.assertTrue(frappe.db.exists("CRM Call Log", old_call_log))
+		self.assertEqual(get_archived_document("CRM Notification", old_read).read, 1)
+
+	def test_archived_call_logs_leave_the_timeline(self):
+		lead = frappe.get_doc({"doctype": "CRM Lead", "first_name": "Archive Test"}).insert()
+		self.leads.append(lead.name)
+		reference = {"reference_doctype": "CRM Lead", "reference_docname": lead.name}
+		old_call_log = self.make_call_log(days_old=40, **reference)
+		recent_call_log = self.make_call_log(days_old=10, **reference)
+		self.assertTrue(frappe.db.exists("CRM Activity", {"source_name": old_call_log}))
+		self.set_retention(0, 30)
+
+		archive_old_records()
+
+		self.assertFalse(frappe.db.exists("CRM Call Log", old_call_log))
+		self.assertTrue(frappe.db.exists("CRM Call Log", recent_call_log))
+		self.assertFalse(frappe.db.exists("CRM Activity", {"source_name": old_call_log}))
+		self.assertTrue(frappe.db.exists("CRM Activity", {"source_name": recent_call_log}))
+		self.assertIsNotNone(get_archived_document("CRM Call Log", old_call_log))
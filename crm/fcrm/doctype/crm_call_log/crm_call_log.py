@@ -85,15 +85,13 @@ def create_lead_from_call_log(call_log):
 	lead.lead_owner = frappe.session.user
 	lead.save(ignore_permissions=True)
 
-	frappe.db.set_value("CRM Call Log", call_log.get("name"), {
-		"reference_doctype": "CRM Lead",
-		"reference_docname": lead.name
-	})
-
-	if call_log.get("note"):
-		frappe.db.set_value("FCRM Note", call_log.get("note"), {
-			"reference_doctype": "CRM Lead",
-			"reference_docname": lead.name
-		})
+	# saved through the ORM so that their timeline activities move to the lead
+	for doctype, name in [("CRM Call Log", call_log.get("name")), ("FCRM Note", call_log.get("note"))]:
+		if not name:
+			continue
+		doc = frappe.get_doc(doctype, name)
+		doc.reference_doctype = "CRM Lead"
+		doc.reference_docname = lead.name
+		doc.save(ignore_permissions=True)
 
 	return lead.name
\ No newline at end of file
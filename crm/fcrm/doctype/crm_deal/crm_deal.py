@@ -7,8 +7,9 @@ from frappe import _
 from frappe.desk.form.assign_to import add as assign
 from frappe.model.document import Document
 
-from crm.fcrm.doctype.crm_service_level_agreement.utils import get_sla
+from crm.fcrm.doctype.crm_service_level_agreement.utils import add_sla_status_index, get_sla
 from crm.fcrm.doctype.crm_status_change_log.crm_status_change_log import add_status_change_log
+from crm.utils import normalize_phone_number
 
 
 class CRMDeal(Document):
@@ -18,6 +19,7 @@ class CRMDeal(Document):
 	def validate(self):
 		self.set_primary_contact()
 		self.set_primary_email_mobile_no()
+		self.set_normalized_mobile_no()
 		if not self.is_new() and self.has_value_changed("deal_owner") and self.deal_owner:
 			self.share_with_agent(self.deal_owner)
 			self.assign_agent(self.deal_owner)
@@ -68,6 +70,9 @@ class CRMDeal(Document):
 			self.mobile_no = ""
 			self.phone = ""
 
+	def set_normalized_mobile_no(self):
+		self.normalized_mobile_no = normalize_phone_number(self.mobile_no)
+
 	def assign_agent(self, agent):
 		if not agent:
 			return
@@ -121,7 +126,7 @@ class CRMDeal(Document):
 		"""
 		if not self.sla:
 			return
-		sla = frappe.get_last_doc("CRM Service Level Agreement", {"name": self.sla})
+		sla = frappe.get_cached_doc("CRM Service Level Agreement", self.sla)
 		if sla:
 			sla.apply(self)
 
@@ -198,6 +203,11 @@ class CRMDeal(Document):
 			"kanban_fields": '["annual_revenue", "email", "mobile_no", "_assign", "modified"]'
 		}
 
+
+def on_doctype_update():
+	add_sla_status_index("CRM Deal")
+
+
 @frappe.whitelist()
 def add_contact(deal, contact):
 	if not frappe.has_permission("CRM Deal", "write", deal):
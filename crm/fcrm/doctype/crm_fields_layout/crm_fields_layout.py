@@ -6,6 +6,8 @@ import frappe
 from frappe import _
 from frappe.model.document import Document
 
+from crm.api.meta import get_field_descriptors
+
 
 class CRMFieldsLayout(Document):
 	pass
@@ -27,7 +29,7 @@ def get_fields_layout(doctype: str, type: str):
 			continue
 		allowed_fields.extend(section.get("fields"))
 
-	fields = frappe.get_meta(doctype).fields
+	fields = get_field_descriptors(doctype)
 	fields = [field for field in fields if field.fieldname in allowed_fields]
 
 	for section in sections:
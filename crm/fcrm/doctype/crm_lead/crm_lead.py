@@ -8,8 +8,9 @@ from frappe.desk.form.assign_to import add as assign
 from frappe.model.document import Document
 
 from frappe.utils import has_gravatar, validate_email_address
-from crm.fcrm.doctype.crm_service_level_agreement.utils import get_sla
+from crm.fcrm.doctype.crm_service_level_agreement.utils import add_sla_status_index, get_sla
 from crm.fcrm.doctype.crm_status_change_log.crm_status_change_log import add_status_change_log
+from crm.utils import normalize_phone_number
 
 
 class CRMLead(Document):
@@ -21,6 +22,7 @@ class CRMLead(Document):
 		self.set_lead_name()
 		self.set_title()
 		self.validate_email()
+		self.set_normalized_mobile_no()
 		if not self.is_new() and self.has_value_changed("lead_owner") and self.lead_owner:
 			self.share_with_agent(self.lead_owner)
 			self.assign_agent(self.lead_owner)
@@ -66,6 +68,9 @@ class CRMLead(Document):
 			if self.is_new() or not self.image:
 				self.image = has_gravatar(self.email)
 
+	def set_normalized_mobile_no(self):
+		self.normalized_mobile_no = normalize_phone_number(self.mobile_no)
+
 	def assign_agent(self, agent):
 		if not agent:
 			return
@@ -248,7 +253,7 @@ class CRMLead(Document):
 		"""
 		if not self.sla:
 			return
-		sla = frappe.get_last_doc("CRM Service Level Agreement", {"name": self.sla})
+		sla = frappe.get_cached_doc("CRM Service Level Agreement", self.sla)
 		if sla:
 			sla.apply(self)
 
@@ -334,6 +339,10 @@ class CRMLead(Document):
 		}
 
 
+def on_doctype_update():
+	add_sla_status_index("CRM Lead")
+
+
 @frappe.whitelist()
 def convert_to_deal(lead, doc=None):
 	if not (doc and doc.flags.get("ignore_permissions")) and not frappe.has_permission("CRM Lead", "write", lead):
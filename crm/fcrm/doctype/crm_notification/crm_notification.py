@@ -1,25 +1,45 @@
 # Copyright (c) 2024, Frappe Technologies Pvt. Ltd. and contributors
 # For license information, please see license.txt
 
+import hashlib
+
 import frappe
-from frappe import _
 from frappe.model.document import Document
+from frappe.utils import cstr, now
+from crm.utils.realtime import publish
+
+DEDUP_FIELDS = [
+	"from_user",
+	"to_user",
+	"type",
+	"notification_type_doctype",
+	"notification_type_doc",
+	"reference_doctype",
+	"reference_name",
+	"message",
+	"notification_text",
+]
 
 
 class CRMNotification(Document):
 	def on_update(self):
-		frappe.publish_realtime("crm_notification")
+		publish("crm_notification", user=self.to_user)
+
+def on_doctype_update():
+	frappe.db.add_index("CRM Notification", ["to_user", "read", "creation"])
 
 def notify_user(args):
 	"""
 	Notify the assigned user
+
+	The notification is written with a plain insert that a repeated one turns
+	into a no-op, so CRM Notification controller hooks do not run for it.
 	"""
 	args = frappe._dict(args)
 	if args.owner == args.assigned_to:
 		return
 
 	values = frappe._dict(
-		doctype="CRM Notification",
 		from_user=args.owner,
 		to_user=args.assigned_to,
 		type=args.notification_type,
@@ -30,7 +50,26 @@ def notify_user(args):
 		reference_doctype=args.redirect_to_doctype,
 		reference_name=args.redirect_to_docname,
 	)
+	values.dedup_key = get_dedup_key(values)
 
-	if frappe.db.exists("CRM Notification", values):
-		return
-	frappe.get_doc(values).insert(ignore_permissions=True)
\ No newline at end of file
+	timestamp = now()
+	values.update(
+		name=frappe.generate_hash(),
+		creation=timestamp,
+		modified=timestamp,
+		owner=frappe.session.user,
+		modified_by=frappe.session.user,
+	)
+
+	# the unique dedup key makes the insert a no-op for a repeated notification
+	frappe.db.bulk_insert("CRM Notification", list(values), [tuple(values.values())], ignore_duplicates=True)
+	if frappe.db.exists("CRM Notification", values.name):
+		publish("crm_notification", user=values.to_user)
+
+def get_dedup_key(values):
+	"""
+	Get the key that identifies a notification, a hash of its users, type,
+	references and content
+	"""
+	key = "\x1f".join(cstr(values.get(field)) for field in DEDUP_FIELDS)
+	return hashlib.sha256(key.encode()).hexdigest()
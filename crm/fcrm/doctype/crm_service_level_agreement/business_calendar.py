@@ -0,0 +1,164 @@
+import math
+from bisect import bisect_left
+from datetime import datetime, time, timedelta
+
+from frappe.utils import get_datetime, get_weekdays, getdate, to_timedelta
+
+
+class BusinessCalendar:
+	"""
+	Working hours of a Service Level Agreement, with interval arithmetic over them
+
+	Each weekday works during the half-open interval [start, end), in seconds
+	from midnight. Weekdays without working hours and holidays do not work.
+	Time spans are computed per day at the edges and per week in between,
+	instead of stepping through them.
+	"""
+
+	def __init__(self, working_hours: dict, holidays=None):
+		"""
+		:param working_hours: (start_time, end_time) keyed by weekday name
+		:param holidays: Dates that are not worked
+		"""
+		self.workdays = [None] * 7
+		for weekday, name in enumerate(get_weekdays()):
+			if name not in working_hours:
+				continue
+			start_time, end_time = working_hours[name]
+			start = to_timedelta(start_time).total_seconds()
+			end = to_timedelta(end_time).total_seconds()
+			self.workdays[weekday] = (start, end)
+
+		self.holidays = {getdate(holiday) for holiday in holidays or []}
+		self.sorted_holidays = sorted(self.holidays)
+		self.week_seconds = sum(self.get_day_seconds(weekday) for weekday in range(7))
+		self.exact_week_seconds = sum(self.get_day_seconds(weekday, exact=True) for weekday in range(7))
+
+	def get_working_seconds(self, start_at, end_at) -> int:
+		"""
+		Count the working seconds from `start_at` till `end_at`
+
+		Seconds are counted the way the SLA always has: by stepping one second at
+		a time from `start_at` and counting the steps whose time of day, without
+		microseconds, is within working hours.
+
+		:return: Number of seconds
+		"""
+		start_at = get_datetime(start_at)
+		end_at = get_datetime(end_at)
+		if end_at <= start_at:
+			return 0
+
+		steps = math.ceil((end_at - start_at).total_seconds())
+		start = start_at.replace(microsecond=0)
+		end = start + timedelta(seconds=steps)
+
+		first_day = start.date()
+		last_day = (end - timedelta(seconds=1)).date()
+		if first_day == last_day:
+			return self.get_overlap(first_day, start, end)
+
+		return (
+			self.get_overlap(first_day, start, end)
+			+ self.get_full_days_seconds(first_day + timedelta(days=1), last_day)
+			+ self.get_overlap(last_day, start, end)
+		)
+
+	def add_working_seconds(self, start_at, seconds):
+		"""
+		Get the datetime at which `seconds` of working time after `start_at` run out
+
+		:return: Datetime, or None if the calendar has no working time at all
+		"""
+		res = get_datetime(start_at)
+		if not seconds:
+			return res
+		if not self.exact_week_seconds:
+			return None
+
+		day = res.date()
+		now = (res - datetime.combine(day, time())).total_seconds()
+		while True:
+			if now == 0:
+				# skip whole weeks at once while the time needed outlasts them
+				while seconds > (week_seconds := self.get_week_seconds(day)):
+					seconds -= week_seconds
+					day += timedelta(days=7)
+
+			hours = self.get_working_hours(day)
+			if hours:
+				begin = max(hours[0], now)
+				time_left = max(hours[1], now) - begin
+				if time_left > 0:
+					if seconds <= time_left:
+						return datetime.combine(day, time()) + timedelta(seconds=begin + seconds)
+					seconds -= time_left
+
+			day += timedelta(days=1)
+			now = 0
+
+	def get_working_hours(self, day):
+		if day in self.holidays:
+			return None
+		return self.workdays[day.weekday()]
+
+	def get_day_seconds(self, weekday, exact=False):
+		"""
+		Working seconds of `weekday`, counted in whole seconds like `get_working_seconds`
+		unless `exact`
+		"""
+		hours = self.workdays[weekday]
+		if not hours:
+			return 0
+		if exact:
+			return max(hours[1] - hours[0], 0)
+		return max(math.ceil(hours[1]) - math.ceil(hours[0]), 0)
+
+	def get_overlap(self, day, start, end) -> int:
+		"""Working seconds of `day` within [start, end)"""
+		hours = self.get_working_hours(day)
+		if not hours:
+			return 0
+		midnight = datetime.combine(day, time())
+		day_start = midnight + timedelta(seconds=math.ceil(hours[0]))
+		day_end = midnight + timedelta(seconds=math.ceil(hours[1]))
+		return max(int((min(end, day_end) - max(start, day_start)).total_seconds()), 0)
+
+	def get_full_days_seconds(self, from_day, to_day) -> int:
+		"""Working seconds of the whole days from `from_day` up to, not including, `to_day`"""
+		days = (to_day - from_day).days
+		if days <= 0:
+			return 0
+
+		weeks, rest = divmod(days, 7)
+		total = weeks * self.week_seconds
+		for i in range(rest):
+			total += self.get_day_seconds((from_day.weekday() + i) % 7)
+
+		return total - self.get_holiday_seconds(from_day, to_day)
+
+	def get_week_seconds(self, day):
+		"""Exact working seconds of the seven days starting at `day`"""
+		return self.exact_week_seconds - self.get_holiday_seconds(day, day + timedelta(days=7), exact=True)
+
+	def get_holiday_seconds(self, from_day, to_day, exact=False):
+		"""Working seconds lost to holidays from `from_day` up to, not including, `to_day`"""
+		start = bisect_left(self.sorted_holidays, from_day)
+		end = bisect_left(self.sorted_holidays, to_day)
+		return sum(
+			self.get_day_seconds(holiday.weekday(), exact)
+			for holiday in self.sorted_holidays[start:end]
+		)
+
+
+class SLACalendar(BusinessCalendar):
+	"""`BusinessCalendar` of a Service Level Agreement, with its priorities"""
+
+	def __init__(self, working_hours: dict, holidays=None, priorities=None, default_priority=None):
+		"""
+		:param priorities: Priority rows keyed by priority
+		:param default_priority: Priority whose communication status is not a response
+		"""
+		super().__init__(working_hours, holidays)
+		self.priorities = priorities or {}
+		self.default_priority = default_priority
@@ -2,6 +2,16 @@
 // For license information, please see license.txt
 
 frappe.ui.form.on("CRM Service Level Agreement", {
+	refresh(frm) {
+		if (frm.is_new()) return;
+		frm.add_custom_button(__("Recompute Leads and Deals"), () => {
+			frappe.call({
+				method: "crm.fcrm.doctype.crm_service_level_agreement.recompute.enqueue_recompute_sla_fields",
+				args: { sla: frm.doc.name },
+				callback: () => frappe.show_alert(__("Recomputing SLA fields in the background")),
+			});
+		});
+	},
 	validate(frm) {
 		let default_priority_count = 0;
 		frm.doc.priorities.forEach(function (row) {
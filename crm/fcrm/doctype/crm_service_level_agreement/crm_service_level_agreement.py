@@ -3,17 +3,17 @@
 
 import frappe
 from frappe import _
-from datetime import timedelta
 from frappe.model.document import Document
 from frappe.utils import (
-	add_to_date,
 	get_datetime,
-	get_weekdays,
-	getdate,
 	now_datetime,
-	time_diff_in_seconds,
 )
-from crm.fcrm.doctype.crm_service_level_agreement.utils import get_context
+from crm.fcrm.doctype.crm_service_level_agreement.business_calendar import SLACalendar
+from crm.fcrm.doctype.crm_service_level_agreement.utils import (
+	clear_sla_cache,
+	get_context,
+	get_sla_calendar,
+)
 
 
 class CRMServiceLevelAgreement(Document):
@@ -21,6 +21,12 @@ class CRMServiceLevelAgreement(Document):
 		self.validate_default()
 		self.validate_condition()
 
+	def on_update(self):
+		clear_sla_cache()
+
+	def on_trash(self):
+		clear_sla_cache()
+
 	def validate_default(self):
 		if self.default:
 			other_slas = frappe.get_all(
@@ -62,7 +68,7 @@ class CRMServiceLevelAgreement(Document):
 		self.set_first_response_time(doc)
 
 	def set_first_responded_on(self, doc: Document):
-		if doc.communication_status != self.get_default_priority():
+		if doc.communication_status != self.get_calendar().default_priority:
 			doc.first_responded_on = (
 				doc.first_responded_on or now_datetime()
 			)
@@ -81,7 +87,7 @@ class CRMServiceLevelAgreement(Document):
 		start_time = doc.sla_creation
 		communication_status = doc.communication_status
 
-		priorities = self.get_priorities()
+		priorities = self.get_calendar().priorities
 		priority = priorities.get(communication_status)
 		if not priority or doc.response_by:
 			return
@@ -112,34 +118,14 @@ class CRMServiceLevelAgreement(Document):
 		start_at: str,
 		duration_seconds: int,
 	):
-		res = get_datetime(start_at)
-		time_needed = duration_seconds
-		holidays = self.get_holidays()
-		weekdays = get_weekdays()
-		workdays = self.get_workdays()
-		while time_needed:
-			today = res
-			today_day = getdate(today)
-			today_weekday = weekdays[today.weekday()]
-			is_workday = today_weekday in workdays
-			is_holiday = today_day in holidays
-			if is_holiday or not is_workday:
-				res = add_to_date(res, days=1, as_datetime=True)
-				continue
-			today_workday = workdays[today_weekday]
-			now_in_seconds = time_diff_in_seconds(today, today_day)
-			start_time = max(today_workday.start_time.total_seconds(), now_in_seconds)
-			till_start_time = max(start_time - now_in_seconds, 0)
-			end_time = max(today_workday.end_time.total_seconds(), now_in_seconds)
-			time_left = max(end_time - start_time, 0)
-			if not time_left:
-				res = getdate(add_to_date(res, days=1, as_datetime=True))
-				continue
-			time_taken = min(time_needed, time_left)
-			time_needed -= time_taken
-			time_required = till_start_time + time_taken
-			res = add_to_date(res, seconds=time_required, as_datetime=True)
-		return res
+		"""
+		Get the time at which `duration_seconds` of working time after `start_at` end
+
+		:param start_at: Date at which calculation starts
+		:param duration_seconds: Working time needed
+		:return: Datetime
+		"""
+		return self.get_calendar().add_working_seconds(start_at, duration_seconds)
 
 	def calc_elapsed_time(self, start_time, end_time) -> float:
 		"""
@@ -149,25 +135,13 @@ class CRMServiceLevelAgreement(Document):
 		:param end_at: Date at which calculation ends
 		:return: Number of seconds
 		"""
-		start_time = get_datetime(start_time)
-		end_time = get_datetime(end_time)
-		holiday_list = []
-		working_day_list = self.get_working_days()
-		working_hours = self.get_working_hours()
-
-		total_seconds = 0
-		current_time = start_time
-
-		while current_time < end_time:
-			in_holiday_list = current_time.date() in holiday_list
-			not_in_working_day_list = get_weekdays()[current_time.weekday()] not in working_day_list
-			if in_holiday_list or not_in_working_day_list or not self.is_working_time(current_time, working_hours):
-				current_time += timedelta(seconds=1)
-				continue
-			total_seconds += 1
-			current_time += timedelta(seconds=1)
-
-		return total_seconds
+		return self.get_calendar().get_working_seconds(start_time, end_time)
+
+	def get_calendar(self) -> SLACalendar:
+		"""
+		Return working hours, holidays and priorities as a cached `SLACalendar`
+		"""
+		return get_sla_calendar(self.name)
 
 	def get_priorities(self):
 		"""
@@ -197,24 +171,12 @@ class CRMServiceLevelAgreement(Document):
 			res[row.workday] = row
 		return res
 
-	def get_working_days(self) -> dict[str, dict]:
-		workdays = []
-		for row in self.working_hours:
-			workdays.append(row.workday)
-		return workdays
-
 	def get_working_hours(self) -> dict[str, dict]:
 		res = {}
 		for row in self.working_hours:
 			res[row.workday] = (row.start_time, row.end_time)
 		return res
 
-	def is_working_time(self, date_time, working_hours):
-		day_of_week = get_weekdays()[date_time.weekday()]
-		start_time, end_time = working_hours.get(day_of_week, (0, 0))
-		date_time = timedelta(hours=date_time.hour, minutes=date_time.minute, seconds=date_time.second)
-		return start_time <= date_time < end_time
-
 	def get_holidays(self):
 		res = []
 		if not self.holiday_list:
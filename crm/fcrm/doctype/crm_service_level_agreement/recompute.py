@@ -0,0 +1,105 @@
+import time
+
+import frappe
+from frappe import _
+from crm.fcrm.doctype.crm_service_level_agreement.utils import SLA_DOCTYPES
+
+RECOMPUTE_CHUNK_SIZE = 1000
+SLA_FIELDS = ["response_by", "first_response_time", "sla_status"]
+
+
+@frappe.whitelist()
+def enqueue_recompute_sla_fields(sla: str):
+	"""Recompute SLA fields of the leads and deals of `sla` in a background job"""
+	frappe.only_for("System Manager")
+	frappe.enqueue(
+		recompute_sla_fields,
+		queue="long",
+		timeout=3600,
+		job_id=f"crm_recompute_sla_fields::{sla}",
+		deduplicate=True,
+		sla_name=sla,
+		publish=True,
+	)
+
+
+def recompute_sla_fields(sla_name: str, chunk_size: int = RECOMPUTE_CHUNK_SIZE, publish=False, progress=None):
+	"""
+	Recompute `response_by`, `first_response_time` and `sla_status` of every lead
+	and deal of an SLA, after its working hours, holidays or priorities changed
+
+	Documents are read in chunks of `chunk_size` without loading them, and only
+	changed fields are written back, one batched update per chunk.
+
+	:param sla_name: SLA whose documents to recompute
+	:param publish: Publish progress to the user who started the job
+	:param progress: Called with doctype, documents done, total and documents per second after each chunk
+	:return: Number of documents updated
+	"""
+	sla = frappe.get_doc("CRM Service Level Agreement", sla_name)
+	updated = 0
+	for doctype in SLA_DOCTYPES:
+		total = frappe.db.count(doctype, {"sla": sla_name})
+		done = 0
+		last_name = ""
+		started_at = time.monotonic()
+		while True:
+			rows = frappe.db.sql(
+				f"""
+				SELECT `name`, `sla_creation`, `communication_status`, `first_responded_on`,
+					`response_by`, `first_response_time`, `sla_status`
+				FROM `tab{doctype}`
+				WHERE `sla` = %(sla)s AND `name` > %(last_name)s
+				ORDER BY `name`
+				LIMIT %(limit)s
+				""",
+				{"sla": sla_name, "last_name": last_name, "limit": chunk_size},
+				as_dict=True,
+			)
+			if not rows:
+				break
+
+			updates = {}
+			for row in rows:
+				changes = get_sla_changes(sla, row)
+				if changes:
+					updates[row.name] = changes
+			if updates:
+				frappe.db.bulk_update(doctype, updates, chunk_size=chunk_size, update_modified=False)
+				frappe.db.commit()
+				updated += len(updates)
+
+			done += len(rows)
+			last_name = rows[-1].name
+			rate = done / max(time.monotonic() - started_at, 0.001)
+			if progress:
+				progress(doctype, done, total, rate)
+			if publish:
+				frappe.publish_progress(
+					done * 100 / (total or 1),
+					title=_("Recomputing SLA {0}").format(sla_name),
+					description=_("{0}: {1} of {2} ({3} per second)").format(
+						_(doctype), done, total, int(rate)
+					),
+				)
+
+	return updated
+
+
+def get_sla_changes(sla, row: frappe._dict) -> dict:
+	"""
+	Apply the targets and status of `sla` to `row` the way a save would, and
+	return the fields that changed
+	"""
+	if not row.sla_creation:
+		return {}
+
+	old = {field: row[field] for field in SLA_FIELDS}
+	row.response_by = None
+	sla.set_response_by(row)
+	# keep the target of documents whose communication status has no priority
+	row.response_by = row.response_by or old["response_by"]
+	sla.set_first_response_time(row)
+	sla.handle_sla_status(row)
+
+	return {field: row[field] for field in SLA_FIELDS if row[field] != old[field]}
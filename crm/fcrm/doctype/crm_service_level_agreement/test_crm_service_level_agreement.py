@@ -1,9 +1,53 @@
 # Copyright (c) 2023, Frappe Technologies Pvt. Ltd. and Contributors
 # See license.txt
 
-# import frappe
+import frappe
 from frappe.tests import UnitTestCase
 
+from crm.fcrm.doctype.crm_service_level_agreement.utils import (
+	_compiled_conditions,
+	eval_condition,
+	get_safe_utils,
+)
+
+CONDITIONS = [
+	'doc.status == "New"',
+	'doc.status in ["New", "Contacted"] and doc.annual_revenue > 1000',
+	"frappe.utils.getdate(doc.creation).year >= 2024",
+	"len(doc.email or '') > 3",
+]
+
 
 class TestCRMServiceLevelAgreement(UnitTestCase):
-	pass
+	def get_context(self, **values):
+		doc = frappe._dict(
+			status="New", annual_revenue=5000, creation="2025-01-01 10:00:00", email="a@b.c", **values
+		)
+		return {"doc": doc, "frappe": frappe._dict(utils=get_safe_utils())}
+
+	def test_compiled_conditions_match_safe_eval(self):
+		for status in ["New", "Contacted", "Lost"]:
+			context = self.get_context(status=status)
+			for i, condition in enumerate(CONDITIONS):
+				sla = {"name": f"SLA {i}", "modified": "1", "condition": condition}
+				self.assertEqual(
+					eval_condition(sla, context),
+					frappe.safe_eval(condition, None, context),
+					condition,
+				)
+
+	def test_unsafe_conditions_are_rejected(self):
+		for condition in ["doc.__class__", "().__class__.__bases__", "_dict"]:
+			sla = {"name": "Unsafe", "modified": condition, "condition": condition}
+			with self.assertRaises(Exception):
+				frappe.safe_eval(condition, None, self.get_context())
+			with self.assertRaises(Exception):
+				eval_condition(sla, self.get_context())
+
+	def test_condition_cache_is_per_site_and_version(self):
+		context = self.get_context()
+		eval_condition({"name": "Cached", "modified": "1", "condition": "True"}, context)
+		self.assertIn((frappe.local.site, "Cached", "1"), _compiled_conditions)
+
+		self.assertFalse(eval_condition({"name": "Cached", "modified": "2", "condition": "False"}, context))
+		self.assertNotIn((frappe.local.site, "Cached", "1"), _compiled_conditions)
@@ -1,9 +1,23 @@
+import unicodedata
+from collections import OrderedDict
+
 import frappe
 from frappe.model.document import Document
-from frappe.query_builder import JoinType
 from frappe.utils.safe_exec import get_safe_globals
-from frappe.utils import now_datetime
-from pypika import Criterion
+from frappe.utils import get_datetime, now_datetime
+from crm.fcrm.doctype.crm_service_level_agreement.business_calendar import SLACalendar
+
+SLA_DOCTYPES = ["CRM Lead", "CRM Deal"]
+SLA_SWEEP_BATCH_SIZE = 1000
+SLA_CACHE_KEY = "crm_enabled_slas"
+SLA_CALENDAR_CACHE_KEY = "crm_sla_calendars"
+SLA_CALENDAR_LRU_SIZE = 128
+
+# compiled conditions keyed by (site, sla name, modified)
+_compiled_conditions = {}
+# compiled calendars keyed by (site, sla name, version), least recently used first
+_sla_calendars = OrderedDict()
+_safe_utils = None
 
 def get_sla(doc: Document) -> Document:
 	"""
@@ -12,40 +26,144 @@ def get_sla(doc: Document) -> Document:
 	:param doc: Lead/Deal to use
 	:return: Applicable SLA
 	"""
-	SLA = frappe.qb.DocType("CRM Service Level Agreement")
-	Priority = frappe.qb.DocType("CRM Service Level Priority")
 	now = now_datetime()
 	priority = doc.communication_status
-	q = (
-		frappe.qb.from_(SLA)
-		.select(SLA.name, SLA.condition)
-		.where(SLA.apply_on == doc.doctype)
-		.where(SLA.enabled == True)
-		.where(Criterion.any([SLA.start_date.isnull(), SLA.start_date <= now]))
-		.where(Criterion.any([SLA.end_date.isnull(), SLA.end_date >= now]))
-	)
-	if priority:
-		q = (
-			q.join(Priority, JoinType.inner)
-			.on(Priority.parent == SLA.name)
-			.where(Priority.priority == priority)
-		)
-	sla_list = q.run(as_dict=True)
-	res = None
+	sla_list = [
+		sla
+		for sla in get_enabled_slas(doc.doctype)
+		if (not sla.start_date or get_datetime(sla.start_date) <= now)
+		and (not sla.end_date or get_datetime(sla.end_date) >= now)
+		and (not priority or priority in sla.priorities)
+	]
 
 	# move default sla to the end of the list
-	for sla in sla_list:
-		if sla.get("default") == True:
-			sla_list.remove(sla)
-			sla_list.append(sla)
-			break
+	sla_list.sort(key=lambda sla: bool(sla.default))
 
+	context = None
 	for sla in sla_list:
-		cond = sla.get("condition")
-		if not cond or frappe.safe_eval(cond, None, get_context(doc)):
-			res = sla
-			break
-	return res
+		if not sla.condition:
+			return sla
+		context = context or get_context(doc)
+		if eval_condition(sla, context):
+			return sla
+
+def get_enabled_slas(apply_on: str) -> list[frappe._dict]:
+	"""
+	Get enabled SLAs of `apply_on` with their priorities
+
+	Cached until an SLA is saved or deleted.
+	"""
+	sla_list = frappe.cache.hget(SLA_CACHE_KEY, apply_on)
+	if sla_list is None:
+		sla_list = frappe.get_all(
+			"CRM Service Level Agreement",
+			filters={"apply_on": apply_on, "enabled": True},
+			fields=["name", "condition", "default", "modified", "start_date", "end_date"],
+		)
+		priorities = frappe.get_all(
+			"CRM Service Level Priority",
+			filters={
+				"parenttype": "CRM Service Level Agreement",
+				"parent": ["in", [sla.name for sla in sla_list]],
+			},
+			fields=["parent", "priority"],
+		) if sla_list else []
+		for sla in sla_list:
+			sla.priorities = [row.priority for row in priorities if row.parent == sla.name]
+		frappe.cache.hset(SLA_CACHE_KEY, apply_on, sla_list)
+
+	return [frappe._dict(sla) for sla in sla_list]
+
+def clear_sla_cache():
+	frappe.cache.delete_value(SLA_CACHE_KEY)
+	clear_sla_calendar_cache()
+
+def get_sla_calendar(sla_name: str) -> SLACalendar:
+	"""
+	Get the compiled calendar of an SLA
+
+	Its working hours, holidays and priorities are kept in redis until the SLA
+	or a holiday list changes. Each process keeps the last
+	`SLA_CALENDAR_LRU_SIZE` calendars built from them.
+
+	:param sla_name: Name of the SLA
+	:return: `SLACalendar` of the SLA
+	"""
+	data = frappe.cache.hget(SLA_CALENDAR_CACHE_KEY, sla_name)
+	if data is None:
+		data = get_sla_calendar_data(sla_name)
+		frappe.cache.hset(SLA_CALENDAR_CACHE_KEY, sla_name, data)
+
+	key = (frappe.local.site, sla_name, data["version"])
+	calendar = _sla_calendars.get(key)
+	if calendar is not None:
+		_sla_calendars.move_to_end(key)
+		return calendar
+
+	calendar = SLACalendar(
+		data["working_hours"],
+		data["holidays"],
+		data["priorities"],
+		data["default_priority"],
+	)
+	_sla_calendars[key] = calendar
+	while len(_sla_calendars) > SLA_CALENDAR_LRU_SIZE:
+		_sla_calendars.popitem(last=False)
+	return calendar
+
+def get_sla_calendar_data(sla_name: str) -> dict:
+	sla = frappe.get_doc("CRM Service Level Agreement", sla_name)
+	return {
+		"version": frappe.generate_hash(length=10),
+		"working_hours": sla.get_working_hours(),
+		"holidays": sla.get_holidays(),
+		"priorities": {
+			priority: {"first_response_time": row.first_response_time}
+			for priority, row in sla.get_priorities().items()
+		},
+		"default_priority": sla.get_default_priority() if sla.priorities else None,
+	}
+
+def clear_sla_calendar_cache():
+	frappe.cache.delete_value(SLA_CALENDAR_CACHE_KEY)
+
+def eval_condition(sla: dict, context: dict):
+	"""
+	Evaluate the condition of `sla` like `frappe.safe_eval`, compiling it only once
+	per site and version of the SLA
+	"""
+	site = frappe.local.site
+	key = (site, sla["name"], str(sla["modified"]))
+	code = _compiled_conditions.get(key)
+	if code is None:
+		code = compile_condition(sla["condition"])
+		for stale in [k for k in _compiled_conditions if k[:2] == (site, sla["name"])]:
+			del _compiled_conditions[stale]
+		_compiled_conditions[key] = code
+
+	return eval(code, get_eval_globals(), context)
+
+def compile_condition(condition: str):
+	"""
+	Compile `condition` the way `frappe.safe_eval` does: normalized, checked for
+	unsafe syntax and compiled with the restricted transformer
+
+	Relies on `frappe.utils.safe_exec` internals, which the tests of this doctype
+	check against `frappe.safe_eval` itself.
+	"""
+	from frappe.utils.safe_exec import FrappeTransformer, _validate_safe_eval_syntax
+	from RestrictedPython import compile_restricted
+
+	condition = unicodedata.normalize("NFKC", condition)
+	_validate_safe_eval_syntax(condition)
+	return compile_restricted(condition, filename="<safe_eval>", mode="eval", policy=FrappeTransformer)
+
+def get_eval_globals() -> dict:
+	from frappe.utils.safe_exec import WHITELISTED_SAFE_EVAL_GLOBALS
+
+	eval_globals = {"__builtins__": {}}
+	eval_globals.update(WHITELISTED_SAFE_EVAL_GLOBALS)
+	return eval_globals
 
 def get_context(d: Document) -> dict:
 	"""
@@ -54,8 +172,72 @@ def get_context(d: Document) -> dict:
 	:param doc: `Document` to add in context
 	:return: Context with `doc` and safe variables
 	"""
-	utils = get_safe_globals().get("frappe").get("utils")
 	return {
-		"doc": d.as_dict(),
-		"frappe": frappe._dict(utils=utils),
-	}
\ No newline at end of file
+		"doc": get_doc_view(d),
+		"frappe": frappe._dict(utils=get_safe_utils()),
+	}
+
+def get_doc_view(d: Document) -> frappe._dict:
+	"""
+	Get the fields of `d` as a dict, like `as_dict` but only with the
+	columns of its doctype
+	"""
+	view = frappe._dict()
+	for fieldname in d.meta.get_valid_columns():
+		view[fieldname] = d.get(fieldname)
+	for df in d.meta.get_table_fields():
+		view[df.fieldname] = [row.as_dict() for row in d.get(df.fieldname) or []]
+	view.doctype = d.doctype
+	return view
+
+def get_safe_utils():
+	"""`frappe.utils` of the safe globals, which only depends on the code and is built once"""
+	global _safe_utils
+	if _safe_utils is None:
+		_safe_utils = get_safe_globals().get("frappe").get("utils")
+	return _safe_utils
+
+def mark_overdue_slas_as_failed():
+	"""
+	Mark leads and deals whose first response is overdue as "Failed"
+
+	`handle_sla_status` only runs when a document is saved, so documents nobody
+	touches would stay "First Response Due" past their `response_by`. Runs from
+	the scheduler and updates in batches of `SLA_SWEEP_BATCH_SIZE`, without
+	loading the documents. `modified` is left as is, so open forms do not go
+	stale. One `crm_sla_failed` realtime event per doctype carries only the
+	number of documents marked, so open views can refresh without learning
+	names of records their users may not read.
+	"""
+	now = now_datetime()
+	for doctype in SLA_DOCTYPES:
+		failed = 0
+		while True:
+			batch = frappe.db.sql_list(
+				f"""
+				SELECT `name` FROM `tab{doctype}`
+				WHERE `sla_status` = 'First Response Due'
+				AND `response_by` < %(now)s
+				AND `first_responded_on` IS NULL
+				LIMIT %(limit)s
+				""",
+				{"now": now, "limit": SLA_SWEEP_BATCH_SIZE},
+			)
+			if not batch:
+				break
+			frappe.db.sql(
+				f"""
+				UPDATE `tab{doctype}` SET `sla_status` = 'Failed'
+				WHERE `name` IN %(names)s
+				""",
+				{"names": batch},
+			)
+			frappe.db.commit()
+			failed += len(batch)
+
+		if failed:
+			frappe.publish_realtime("crm_sla_failed", {"doctype": doctype, "count": failed})
+
+def add_sla_status_index(doctype: str):
+	"""Index the columns `mark_overdue_slas_as_failed` filters on"""
+	frappe.db.add_index(doctype, ["sla_status", "response_by"], "sla_status_response_by_index")
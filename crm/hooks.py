@@ -148,40 +148,82 @@ doc_events = {
 		"on_update": ["crm.api.todo.on_update"],
 	},
 	"Comment": {
-		"on_update": ["crm.api.comment.on_update"],
+		"on_update": ["crm.api.comment.on_update", "crm.fcrm.doctype.crm_activity.crm_activity.update_activity"],
+		"on_trash": ["crm.fcrm.doctype.crm_activity.crm_activity.delete_activity"],
 	},
 	"WhatsApp Message": {
 		"validate": ["crm.api.whatsapp.validate"],
 		"on_update": ["crm.api.whatsapp.on_update"],
 	},
+	"CRM Lead": {
+		"on_update": ["crm.api.doc.clear_total_count_cache"],
+		"on_trash": ["crm.api.doc.clear_total_count_cache", "crm.fcrm.doctype.crm_activity.crm_activity.delete_reference_activities"],
+	},
 	"CRM Deal": {
-		"on_update": ["crm.fcrm.doctype.erpnext_crm_settings.erpnext_crm_settings.create_customer_in_erpnext"],
+		"on_update": [
+			"crm.fcrm.doctype.erpnext_crm_settings.erpnext_crm_settings.create_customer_in_erpnext",
+			"crm.api.doc.clear_total_count_cache",
+		],
+		"on_trash": ["crm.api.doc.clear_total_count_cache", "crm.fcrm.doctype.crm_activity.crm_activity.delete_reference_activities"],
+	},
+	"Version": {
+		"after_insert": ["crm.fcrm.doctype.crm_activity.crm_activity.update_activity"],
+	},
+	"Communication": {
+		"on_update": ["crm.fcrm.doctype.crm_activity.crm_activity.update_activity"],
+		"on_trash": ["crm.fcrm.doctype.crm_activity.crm_activity.delete_activity"],
+	},
+	"File": {
+		"on_update": ["crm.fcrm.doctype.crm_activity.crm_activity.update_activity"],
+		"on_trash": ["crm.fcrm.doctype.crm_activity.crm_activity.delete_activity"],
+	},
+	"CRM Call Log": {
+		"on_update": ["crm.fcrm.doctype.crm_activity.crm_activity.update_activity"],
+		"on_trash": ["crm.fcrm.doctype.crm_activity.crm_activity.delete_activity"],
+	},
+	"FCRM Note": {
+		"on_update": ["crm.fcrm.doctype.crm_activity.crm_activity.update_activity"],
+		"on_trash": ["crm.fcrm.doctype.crm_activity.crm_activity.delete_activity"],
+	},
+	"CRM Task": {
+		"on_update": ["crm.fcrm.doctype.crm_activity.crm_activity.update_activity"],
+		"on_trash": ["crm.fcrm.doctype.crm_activity.crm_activity.delete_activity"],
 	},
 	"User": {
 		"before_validate": ["crm.api.demo.validate_user"],
-	}
+		"on_update": ["crm.api.session.clear_users_cache"],
+		"after_rename": ["crm.api.session.clear_users_cache"],
+		"on_trash": ["crm.api.session.clear_users_cache"],
+	},
+	"Has Role": {
+		"on_update": ["crm.api.session.clear_users_cache"],
+		"on_trash": ["crm.api.session.clear_users_cache"],
+	},
+	"DocType": {
+		"on_update": ["crm.api.meta.clear_field_descriptors_cache"],
+		"on_trash": ["crm.api.meta.clear_field_descriptors_cache"],
+	},
+	"Custom Field": {
+		"on_update": ["crm.api.meta.clear_field_descriptors_cache"],
+		"on_trash": ["crm.api.meta.clear_field_descriptors_cache"],
+	},
+	"Property Setter": {
+		"on_update": ["crm.api.meta.clear_field_descriptors_cache"],
+		"on_trash": ["crm.api.meta.clear_field_descriptors_cache"],
+	},
 }
 
 # Scheduled Tasks
 # ---------------
 
-# scheduler_events = {
-#	"all": [
-#		"crm.tasks.all"
-#	],
-#	"daily": [
-#		"crm.tasks.daily"
-#	],
-#	"hourly": [
-#		"crm.tasks.hourly"
-#	],
-#	"weekly": [
-#		"crm.tasks.weekly"
-#	],
-#	"monthly": [
-#		"crm.tasks.monthly"
-#	],
-# }
+scheduler_events = {
+	"all": [
+		"crm.fcrm.doctype.crm_service_level_agreement.utils.mark_overdue_slas_as_failed"
+	],
+	"daily_long": [
+		"crm.fcrm.doctype.crm_archived_record.crm_archived_record.archive_old_records"
+	],
+}
 
 # Testing
 # -------
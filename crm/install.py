@@ -16,6 +16,7 @@ def after_install(force=False):
 	add_default_fields_layout(force)
 	add_property_setter()
 	add_email_template_custom_fields()
+	add_contact_phone_custom_fields()
 	add_default_industries()
 	add_default_lead_sources()
 	frappe.db.commit()
@@ -218,6 +219,29 @@ def add_email_template_custom_fields():
 		frappe.clear_cache(doctype="Email Template")
 
 
+def add_contact_phone_custom_fields():
+	if not frappe.get_meta("Contact Phone").has_field("normalized_phone"):
+		click.secho("* Installing Custom Fields in Contact Phone")
+
+		create_custom_fields(
+			{
+				"Contact Phone": [
+					{
+						"fieldname": "normalized_phone",
+						"fieldtype": "Data",
+						"label": "Normalized Phone",
+						"hidden": 1,
+						"read_only": 1,
+						"search_index": 1,
+						"insert_after": "phone",
+					},
+				]
+			}
+		)
+
+		frappe.clear_cache(doctype="Contact Phone")
+
+
 def add_default_industries():
 	industries = ["Accounting", "Advertising", "Aerospace", "Agriculture", "Airline", "Apparel & Accessories", "Automotive", "Banking", "Biotechnology", "Broadcasting", "Brokerage", "Chemical", "Computer", "Consulting", "Consumer Products", "Cosmetics", "Defense", "Department Stores", "Education", "Electronics", "Energy", "Entertainment & Leisure, Executive Search", "Financial Services", "Food", "Beverage & Tobacco", "Grocery", "Health Care", "Internet Publishing", "Investment Banking", "Legal", "Manufacturing", "Motion Picture & Video", "Music", "Newspaper Publishers", "Online Auctions", "Pension Funds", "Pharmaceuticals", "Private Equity", "Publishing", "Real Estate", "Retail & Wholesale", "Securities & Commodity Exchanges", "Service", "Soap & Detergent", "Software", "Sports", "Technology", "Telecommunications", "Television", "Transportation", "Venture Capital"]
 
@@ -4,7 +4,7 @@ import json
 import frappe
 from frappe import _
 from .twilio_handler import Twilio, IncomingCall, TwilioCallDetails
-from .utils import parse_mobile_no
+from crm.utils import get_lead_or_deal_from_number as find_lead_or_deal_from_number
 
 @frappe.whitelist()
 def is_enabled():
@@ -88,8 +88,10 @@ def update_call_log(call_sid, status=None):
 	call_log.start_time = get_datetime_from_timestamp(call_details.start_time)
 	call_log.end_time = get_datetime_from_timestamp(call_details.end_time)
 	if call_log.note and call_log.reference_docname:
-		frappe.db.set_value("FCRM Note", call_log.note, "reference_doctype", call_log.reference_doctype)
-		frappe.db.set_value("FCRM Note", call_log.note, "reference_docname", call_log.reference_docname)
+		note = frappe.get_doc("FCRM Note", call_log.note)
+		note.reference_doctype = call_log.reference_doctype
+		note.reference_docname = call_log.reference_docname
+		note.save(ignore_permissions=True)
 	call_log.flags.ignore_permissions = True
 	call_log.save()
 	frappe.db.commit()
@@ -101,7 +103,7 @@ def update_recording_info(**kwargs):
 		recording_url = args.RecordingUrl
 		call_sid = args.CallSid
 		update_call_log(call_sid)
-		frappe.db.set_value("CRM Call Log", call_sid, "recording_url", recording_url)
+		set_call_log_values(call_sid, recording_url=recording_url)
 	except:
 		frappe.log_error(title=_("Failed to capture Twilio recording"))
 
@@ -150,33 +152,21 @@ def add_note_to_call_log(call_sid, note):
 	call_details = twilio.get_call_info(call_sid)
 	sid = call_sid if call_details.direction == 'inbound' else call_details.parent_call_sid
 
-	frappe.db.set_value("CRM Call Log", sid, "note", note)
+	set_call_log_values(sid, note=note)
 	frappe.db.commit()
 
-def get_lead_or_deal_from_number(call):
-	"""Get lead/deal from the given number.
+def set_call_log_values(call_sid, **values):
+	"""Update call log through the ORM, so that its timeline activity follows.
 	"""
+	if not frappe.db.exists("CRM Call Log", call_sid): return
 
-	def find_record(doctype, mobile_no, where=''):
-		mobile_no = parse_mobile_no(mobile_no)
-		
-		query = f"""
-			SELECT name, mobile_no
-			FROM `tab{doctype}`
-			WHERE CONCAT('+', REGEXP_REPLACE(mobile_no, '[^0-9]', '')) = {mobile_no}
-		"""
-
-		data = frappe.db.sql(query + where, as_dict=True)
-		return data[0].name if data else None
+	call_log = frappe.get_doc("CRM Call Log", call_sid)
+	call_log.update(values)
+	call_log.flags.ignore_permissions = True
+	call_log.save()
 
-	doctype = "CRM Deal"
+def get_lead_or_deal_from_number(call):
+	"""Get lead/deal from the given number.
+	"""
 	number = call.get('to') if call.type == 'Outgoing' else call.get('from')
-
-	doc = find_record(doctype, number) or None
-	if not doc:
-		doctype = "CRM Lead"
-		doc = find_record(doctype, number, 'AND converted is not True')
-		if not doc:
-			doc = find_record(doctype, number)
-
-	return doc, doctype
\ No newline at end of file
+	return find_lead_or_deal_from_number(number)
@@ -0,0 +1,6 @@
+from crm.fcrm.doctype.crm_service_level_agreement.utils import SLA_DOCTYPES, add_sla_status_index
+
+
+def execute():
+	for doctype in SLA_DOCTYPES:
+		add_sla_status_index(doctype)
@@ -0,0 +1,7 @@
+import frappe
+
+
+def execute():
+	# WhatsApp Message belongs to frappe_whatsapp, which may not be installed
+	if frappe.db.table_exists("WhatsApp Message"):
+		frappe.db.add_index("WhatsApp Message", ["reference_doctype", "reference_name", "creation"])
@@ -0,0 +1,34 @@
+import frappe
+
+from crm.fcrm.doctype.crm_notification.crm_notification import DEDUP_FIELDS, get_dedup_key
+
+CHUNK_SIZE = 1000
+
+
+def execute():
+	seen = set()
+	last_name = ""
+	while True:
+		notifications = frappe.get_all(
+			"CRM Notification",
+			filters={"name": [">", last_name]},
+			fields=["name", "dedup_key", *DEDUP_FIELDS],
+			order_by="name asc",
+			limit=CHUNK_SIZE,
+		)
+		if not notifications:
+			break
+
+		updates = {}
+		for notification in notifications:
+			key = get_dedup_key(notification)
+			# older duplicates keep a NULL dedup_key, which the unique index allows
+			if key in seen:
+				continue
+			seen.add(key)
+			if notification.dedup_key != key:
+				updates[notification.name] = {"dedup_key": key}
+
+		if updates:
+			frappe.db.bulk_update("CRM Notification", updates, update_modified=False)
+		last_name = notifications[-1].name
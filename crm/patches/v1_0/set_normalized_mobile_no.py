@@ -0,0 +1,20 @@
+import frappe
+from crm.install import add_contact_phone_custom_fields
+
+
+def execute():
+	add_contact_phone_custom_fields()
+
+	# same normalization as crm.utils.normalize_phone_number
+	for doctype, source, target in [
+		("CRM Lead", "mobile_no", "normalized_mobile_no"),
+		("CRM Deal", "mobile_no", "normalized_mobile_no"),
+		("Contact Phone", "phone", "normalized_phone"),
+	]:
+		frappe.db.sql(
+			f"""
+			UPDATE `tab{doctype}`
+			SET `{target}` = CONCAT('+', REGEXP_REPLACE(`{source}`, '[^0-9]', ''))
+			WHERE `{source}` REGEXP '[0-9]'
+			"""
+		)
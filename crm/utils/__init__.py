@@ -0,0 +1,57 @@
+import re
+
+import frappe
+
+
+def normalize_phone_number(number: str) -> str:
+	"""Normalize phone number to a `+` followed by its digits.
+	This is the form stored in `normalized_mobile_no` fields.
+	>>> normalize_phone_number('+91 (766) 667 6666')
+	... '+917666676666'
+	"""
+	digits = re.sub(r"[^0-9]", "", number or "")
+	return "+" + digits if digits else ""
+
+
+def get_lead_or_deal_from_number(number: str):
+	"""Get lead/deal from the given number, with indexed lookups on `normalized_mobile_no`
+	and on the numbers of the contacts linked to deals.
+	"""
+
+	def find_record(doctype, mobile_no, filters=None):
+		return frappe.db.get_value(
+			doctype,
+			{"normalized_mobile_no": mobile_no, **(filters or {})},
+			"name",
+		)
+
+	number = normalize_phone_number(number)
+	doctype = "CRM Deal"
+	if not number:
+		return None, "CRM Lead"
+
+	doc = find_record(doctype, number) or find_deal_by_contact(number)
+	if not doc:
+		doctype = "CRM Lead"
+		doc = find_record(doctype, number, {"converted": 0})
+		if not doc:
+			doc = find_record(doctype, number)
+
+	return doc, doctype
+
+
+def find_deal_by_contact(number: str):
+	"""Get a deal linked to a contact with the given normalized number, if any."""
+	contacts = frappe.get_all(
+		"Contact Phone",
+		filters={"parenttype": "Contact", "normalized_phone": number},
+		pluck="parent",
+	)
+	if not contacts:
+		return None
+
+	return frappe.db.get_value(
+		"CRM Contacts",
+		{"parenttype": "CRM Deal", "contact": ["in", contacts]},
+		"parent",
+	)
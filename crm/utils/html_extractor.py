@@ -0,0 +1,124 @@
+import timeit
+from html.parser import HTMLParser
+
+
+class ElementExtractor(HTMLParser):
+	"""
+	Streaming extractor of elements from small HTML fragments
+
+	Collects the attributes, and optionally the text, of each `tag` element
+	whose attributes include `attrs`, without building a tree. Matching
+	elements nested in another match are part of the outer one only.
+	"""
+
+	def __init__(self, tag: str, attrs: dict | None = None, with_text: bool = False, limit: int | None = None):
+		super().__init__(convert_charrefs=True)
+		self.tag = tag
+		self.attrs = attrs or {}
+		self.with_text = with_text
+		self.limit = limit
+		self.elements = []
+		self.current = None
+		self.depth = 0
+
+	def handle_starttag(self, tag, attrs):
+		if tag != self.tag:
+			return
+		if self.current is not None:
+			self.depth += 1
+			return
+
+		attrs = dict(attrs)
+		if all(attrs.get(key) == value for key, value in self.attrs.items()):
+			self.current = {"attrs": attrs, "text": []}
+			self.depth = 1
+
+	def handle_endtag(self, tag):
+		if tag != self.tag or self.current is None:
+			return
+		self.depth -= 1
+		if not self.depth:
+			self.finish_element()
+
+	def handle_data(self, data):
+		if self.current is not None and self.with_text:
+			self.current["text"].append(data)
+
+	def finish_element(self):
+		self.elements.append((self.current["attrs"], "".join(self.current["text"])))
+		self.current = None
+		if self.limit and len(self.elements) >= self.limit:
+			raise StopExtraction
+
+	def close(self):
+		super().close()
+		# unclosed elements run till the end, like they do in a tree
+		if self.current is not None:
+			self.finish_element()
+
+
+class StopExtraction(Exception):
+	pass
+
+
+def extract_elements(html: str, tag: str, attrs: dict | None = None, with_text: bool = False, limit: int | None = None):
+	"""
+	Get `(attributes, text)` of the `tag` elements of `html` whose attributes
+	include `attrs`
+
+	:param with_text: Also collect the text of the elements, with entities decoded
+	:param limit: Stop after this many elements
+	"""
+	parser = ElementExtractor(tag, attrs, with_text, limit)
+	try:
+		parser.feed(html or "")
+		parser.close()
+	except StopExtraction:
+		pass
+	return parser.elements
+
+
+def find_element(html: str, tag: str, attrs: dict | None = None, with_text: bool = False):
+	"""Get `(attributes, text)` of the first `tag` element of `html`, or None"""
+	elements = extract_elements(html, tag, attrs, with_text, limit=1)
+	return elements[0] if elements else None
+
+
+def benchmark(number: int = 10000):
+	"""
+	Compare the per call cost of the extractors against BeautifulSoup on the
+	fragments they parse most: attachment logs and comments with mentions
+
+	Run with `bench --site <site> execute crm.utils.html_extractor.benchmark`.
+	"""
+	from bs4 import BeautifulSoup
+
+	attachment_log = '<a href="/private/files/quote.pdf" target="_blank">quote.pdf</a>'
+	comment = (
+		"<p>Can you check this, "
+		'<span class="mention" data-type="mention" data-id="jane@example.com" data-label="Jane Doe">@Jane Doe</span>'
+		' and <span class="mention" data-type="mention" data-id="john@example.com" data-label="John">@John</span>?</p>'
+	)
+
+	cases = {
+		"attachment log": (
+			lambda: BeautifulSoup(attachment_log, "html.parser").find("a"),
+			lambda: find_element(attachment_log, "a", with_text=True),
+		),
+		"mentions": (
+			lambda: BeautifulSoup(comment, "html.parser").find_all("span", attrs={"data-type": "mention"}),
+			lambda: extract_elements(comment, "span", {"data-type": "mention"}),
+		),
+	}
+
+	results = {}
+	for case, (soup, extractor) in cases.items():
+		soup_cost = timeit.timeit(soup, number=number) / number * 1e6
+		extractor_cost = timeit.timeit(extractor, number=number) / number * 1e6
+		results[case] = {
+			"beautifulsoup_us": round(soup_cost, 2),
+			"extractor_us": round(extractor_cost, 2),
+			"speedup": round(soup_cost / extractor_cost, 1),
+		}
+
+	return results
@@ -0,0 +1,34 @@
+import frappe
+
+
+def publish(event: str, message=None, user: str | None = None, doctype: str | None = None, docname: str | None = None):
+	"""
+	Publish a realtime event to `user`, or to the room of a document, after the
+	transaction commits
+
+	Unlike a site-wide broadcast, only the browsers of the user or the ones with
+	the document open receive it. Events queued in the same transaction for the
+	same recipient are sent once, with the last message, and none are sent if the
+	transaction rolls back.
+	"""
+	if not user and not (doctype and docname):
+		return
+
+	events = getattr(frappe.local, "crm_realtime_events", None)
+	if events is None:
+		events = frappe.local.crm_realtime_events = {}
+		frappe.db.after_commit.add(flush)
+		frappe.db.after_rollback.add(discard)
+
+	events[(event, user, doctype, docname)] = message
+
+
+def flush():
+	events = getattr(frappe.local, "crm_realtime_events", None) or {}
+	frappe.local.crm_realtime_events = None
+	for (event, user, doctype, docname), message in events.items():
+		frappe.publish_realtime(event, message, user=user, doctype=doctype, docname=docname)
+
+
+def discard():
+	frappe.local.crm_realtime_events = None
@@ -1,25 +1,59 @@
 import { defineStore } from 'pinia'
 import { createResource } from 'frappe-ui'
-import { computed, ref } from 'vue'
+import { computed, ref, watch } from 'vue'
 
 export const visible = ref(false)
 
+export const notificationList = ref([])
+const nextCursor = ref(null)
+
 export const notifications = createResource({
-  url: 'crm.api.notifications.get_notifications',
-  initialData: [],
+  url: 'crm.api.notifications.get_notifications_page',
+  onSuccess(data) {
+    notificationList.value = data.notifications
+    nextCursor.value = data.next_cursor
+  },
+})
+
+const moreNotifications = createResource({
+  url: 'crm.api.notifications.get_notifications_page',
+  onSuccess(data) {
+    notificationList.value = [...notificationList.value, ...data.notifications]
+    nextCursor.value = data.next_cursor
+  },
+})
+
+export const hasMoreNotifications = computed(() => Boolean(nextCursor.value))
+
+export function loadMoreNotifications() {
+  if (!nextCursor.value || moreNotifications.loading) return
+  moreNotifications.submit({ cursor: nextCursor.value })
+}
+
+// the badge only needs the count, the list is loaded when it is shown
+const unreadCount = createResource({
+  url: 'crm.api.notifications.get_unread_count',
+  initialData: 0,
   auto: true,
 })
 
-export const unreadNotificationsCount = computed(
-  () => notifications.data?.filter((n) => !n.read).length || 0,
-)
+export const unreadNotificationsCount = computed(() => unreadCount.data || 0)
+
+export function reloadNotifications() {
+  unreadCount.reload()
+  if (notifications.fetched) notifications.reload()
+}
+
+watch(visible, (value) => {
+  if (value) notifications.reload()
+})
 
 export const notificationsStore = defineStore('crm-notifications', () => {
   const mark_as_read = createResource({
     url: 'crm.api.notifications.mark_as_read',
     onSuccess: () => {
       mark_as_read.params = {}
-      notifications.reload()
+      reloadNotifications()
     },
   })
 